@@ -1,30 +1,35 @@
 #-------------- final code below --------------------------
 # Required libraries
+import gc
 import os
-from flask import Flask, request, render_template
-from werkzeug.utils import secure_filename
-
-import nltk
-nltk.download('punkt')
-from nltk.tokenize import word_tokenize
-
-from googletrans import Translator
+import string
+import time
+from functools import lru_cache
+from flask import Flask, request, render_template, jsonify, Response, stream_with_context, send_file, url_for, g
+from flask import before_render_template, template_rendered
+
+# Heavy NLP dependencies (nltk, googletrans, enchant) are loaded on first use
+import resources
+from resources import word_tokenize
 import idiomcorpus
-import enchant
+import offline_translation
+import notations
+import compiled_dictionaries
+import batch_translation
+import async_pipeline
+import streaming
+import jobs
+import sentiment
+import translation_cache
+import deadlines
+import tokenstream
+import metrics
+import profiling
 import sqlite3
 from sqlite3 import Error
 
-# Add TextBlob for sentiment analysis
-from textblob import TextBlob
-
-# Plotly for visualization
-import plotly
-import plotly.graph_objs as go
-import json
-
-# Initialize dictionary and translator
-d = enchant.Dict("en_US")
-translator = Translator()
+# Plotly for visualization (imported when the chart template is first built)
+import chart
 
 # Initialize the Flask application
 app = Flask(__name__, template_folder='template/HTML')
@@ -35,115 +40,92 @@ ALLOWED_EXTENSIONS = {'txt'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['TRANSLATE_CONCURRENCY'] = 8  # Translator calls in flight per request (async pipeline)
+app.config['TRANSLATE_TIMEOUT'] = 10.0  # Seconds before a translator call is abandoned
+app.config['REQUEST_DEADLINE'] = 10.0  # Seconds a request may spend in translator calls before they are skipped
+app.config['BREAKER_FAILURES'] = 5  # Consecutive failures that stop calls to a translator backend
+app.config['BREAKER_RESET'] = 30.0  # Seconds before a stopped backend gets a trial call
+app.config['TRANSLATION_ENGINE'] = 'google'  # 'google', or 'offline' for the local Hinglish lexicon
+app.config['RETRANSLATE_MODE'] = 'spans'  # Second translation pass: 'spans' (untranslated and idiom tokens only), 'full' or 'off'
+# Load NLP data and heavy modules after start-up; HINGLISH_PRELOAD=0 loads them on first use instead
+app.config['PRELOAD_IN_BACKGROUND'] = os.environ.get('HINGLISH_PRELOAD', '1') != '0'
+app.config['JOB_WORKERS'] = 2  # Worker processes for background file conversions
+app.config['JOBS_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'jobs')  # Job inputs and results
+app.config['PROFILE_TOKEN'] = os.environ.get('HINGLISH_PROFILE_TOKEN')  # Admin token for per-request profiling (off when unset)
+app.config['PROFILE_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'profiles')  # Saved request profiles
 app.secret_key = os.urandom(24)  # More secure secret key generation
 
-# Global variables
-text1 = []
-text2 = []
-file_content = ""
-filename = ""
-result = ''
-sentiment_result = ''
-
 # Database path
 DATABASE_PATH = "Database.db"  # Path to the uploaded database
 
+# Short -> long notation table, loaded once and reloaded when the database changes
+notation_index = notations.NotationIndex(DATABASE_PATH, tokenize=word_tokenize,
+                                        dictionaries_file=compiled_dictionaries.DICTIONARIES_PATH)
+
+# On-disk cache of translator results, shared by all worker processes
+TRANSLATION_CACHE_PATH = "translation_cache.db"
+translations = translation_cache.TranslationCache(TRANSLATION_CACHE_PATH)
+
+# Translation engines a request can choose from
+TRANSLATION_ENGINES = ('google', 'offline')
+
+# One circuit breaker per translator backend (per process)
+breakers = {backend: deadlines.CircuitBreaker(backend, app.config['BREAKER_FAILURES'], app.config['BREAKER_RESET'])
+            for backend in ('google', 'mtranslate')}
+for backend, breaker in breakers.items():
+    metrics.register_circuit(backend, breaker)
+
+# Load the idiom corpus and the offline lexicon once, before any worker is forked, and keep
+# the loaded objects out of the garbage collector so forked workers keep sharing their pages
+idiomcorpus.load_idioms()
+offline_translation.load_lexicon()
+gc.freeze()
+
+# Check the NLTK data offline and warm up the lazily loaded dependencies without
+# delaying start-up; a request arriving earlier loads what it needs itself
+if app.config['PRELOAD_IN_BACKGROUND']:
+    resources.preload_in_background([resources.tokenizer, resources.dictionary,
+                                     resources.translator, sentiment.load_lexicon, chart.figure_template,
+                                     notation_index.notation_trie])
+
 
 #generate sentiment-chart
-def generate_sentiment_chart(text, polarity):
-    # Tokenize the text and analyze sentiment of each word
-    words = text.split()
-    total_words = len(words)
-    
-    # Sentiment analysis for each word
-    word_sentiments = [TextBlob(word).sentiment.polarity for word in words]
-    
-    # Categorize words
-    negative_words = [word for word, sent in zip(words, word_sentiments) if sent < -0.05]
-    neutral_words = [word for word, sent in zip(words, word_sentiments) if -0.05 <= sent <= 0.05]
-    positive_words = [word for word, sent in zip(words, word_sentiments) if sent > 0.05]
+@metrics.stage_seconds.timed('chart')
+def generate_sentiment_chart(text, polarity, words=None):
+    # The chart looks the same for every polarity; the argument is kept for callers
+    # Categorized words come from the same (memoized) sentiment engine pass as analyze_sentiment
+    analysis = sentiment.analyze(text) if words is None else sentiment.analyze_words(words)
+    negative_words, neutral_words, positive_words = analysis.negative, analysis.neutral, analysis.positive
+    # Empty or whitespace-only text has no words: every bar stays at 0%
+    total_words = len(negative_words) + len(neutral_words) + len(positive_words) or 1
     
     # Calculate percentages
     negative_percent = len(negative_words) / total_words * 100
     neutral_percent = len(neutral_words) / total_words * 100
     positive_percent = len(positive_words) / total_words * 100
     
-    # Prepare data for the chart
-    categories = ['Negative', 'Neutral', 'Positive']
-    
-    # Determine the sentiment type and create bar values
-    if polarity < -0.05:  # Negative sentiment
-        bar_values = [negative_percent, neutral_percent, positive_percent]
-        colors = ['#FF6B6B', '#4ECDC4', '#45B7D1']
-        hover_text = [
-            f'Negative Words: {len(negative_words)}<br>Percentage: {negative_percent:.2f}%<br>Words: {", ".join(negative_words[:5])}{"..." if len(negative_words) > 5 else ""}',
-            f'Neutral Words: {len(neutral_words)}<br>Percentage: {neutral_percent:.2f}%<br>Words: {", ".join(neutral_words[:5])}{"..." if len(neutral_words) > 5 else ""}',
-            f'Positive Words: {len(positive_words)}<br>Percentage: {positive_percent:.2f}%<br>Words: {", ".join(positive_words[:5])}{"..." if len(positive_words) > 5 else ""}'
-        ]
-    elif polarity > 0.05:  # Positive sentiment
-        bar_values = [negative_percent, neutral_percent, positive_percent]
-        colors = ['#FF6B6B', '#4ECDC4', '#45B7D1']
-        hover_text = [
-            f'Negative Words: {len(negative_words)}<br>Percentage: {negative_percent:.2f}%<br>Words: {", ".join(negative_words[:5])}{"..." if len(negative_words) > 5 else ""}',
-            f'Neutral Words: {len(neutral_words)}<br>Percentage: {neutral_percent:.2f}%<br>Words: {", ".join(neutral_words[:5])}{"..." if len(neutral_words) > 5 else ""}',
-            f'Positive Words: {len(positive_words)}<br>Percentage: {positive_percent:.2f}%<br>Words: {", ".join(positive_words[:5])}{"..." if len(positive_words) > 5 else ""}'
-        ]
-    else:  # Neutral sentiment
-        bar_values = [negative_percent, neutral_percent, positive_percent]
-        colors = ['#FF6B6B', '#4ECDC4', '#45B7D1']
-        hover_text = [
-            f'Negative Words: {len(negative_words)}<br>Percentage: {negative_percent:.2f}%<br>Words: {", ".join(negative_words[:5])}{"..." if len(negative_words) > 5 else ""}',
-            f'Neutral Words: {len(neutral_words)}<br>Percentage: {neutral_percent:.2f}%<br>Words: {", ".join(neutral_words[:5])}{"..." if len(neutral_words) > 5 else ""}',
-            f'Positive Words: {len(positive_words)}<br>Percentage: {positive_percent:.2f}%<br>Words: {", ".join(positive_words[:5])}{"..." if len(positive_words) > 5 else ""}'
-        ]
-    
-    # Create Plotly bar chart
-    fig = go.Figure(data=[
-        go.Bar(
-            x=categories, 
-            y=bar_values, 
-            marker_color=colors,
-            text=[f'{val:.2f}%' for val in bar_values],
-            textposition='auto',
-            hovertext=hover_text,
-            hoverinfo='text'
-        )
-    ])
-    
-    # Customize layout
-    fig.update_layout(
-        title='Sentiment Analysis Breakdown',
-        xaxis_title='Sentiment Categories',
-        yaxis_title='Percentage of Words',
-        height=500,
-        width=500,
-        template='plotly_white'
-    )
+    # Bar values and hover text are the only per-request data; the figure layout is cached
+    bar_values = [negative_percent, neutral_percent, positive_percent]
+    hover_text = [
+        f'Negative Words: {len(negative_words)}<br>Percentage: {negative_percent:.2f}%<br>Words: {", ".join(negative_words[:5])}{"..." if len(negative_words) > 5 else ""}',
+        f'Neutral Words: {len(neutral_words)}<br>Percentage: {neutral_percent:.2f}%<br>Words: {", ".join(neutral_words[:5])}{"..." if len(neutral_words) > 5 else ""}',
+        f'Positive Words: {len(positive_words)}<br>Percentage: {positive_percent:.2f}%<br>Words: {", ".join(positive_words[:5])}{"..." if len(positive_words) > 5 else ""}'
+    ]
     
     # Convert to JSON for rendering
-    graphJSON = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+    graphJSON = chart.sentiment_chart_json(bar_values, hover_text)
     return graphJSON
 
-def analyze_sentiment(text):
-    blob = TextBlob(text)
-    
-    # Determine sentiment based on polarity with three categories
-    polarity = blob.sentiment.polarity
-    
-    if polarity > 0.05:
-        sentiment = 'Positive'
-        emoji = '😄'  # Smiling face
-    elif polarity < -0.05:
-        sentiment = 'Negative'
-        emoji = '😞'  # Sad face
-    else:
-        sentiment = 'Neutral'
-        emoji = '😐'  # Neutral face
+@metrics.stage_seconds.timed('sentiment')
+def analyze_sentiment(text, words=None):
+    # Overall polarity, label and emoji from the single-pass sentiment engine;
+    # `words` (a tuple equal to text.split()) skips splitting the text again
+    analysis = sentiment.analyze(text) if words is None else sentiment.analyze_words(words)
     
     return {
-        'sentiment': sentiment,
-        'polarity': round(polarity, 2),
-        'emoji': emoji
+        'sentiment': analysis.sentiment,
+        'polarity': round(analysis.polarity, 2),
+        'emoji': analysis.emoji
     }
 
 def allowed_file(filename):
@@ -166,79 +148,425 @@ def connection(db_file):
 
 def fetch_notations(rtext):
     """
-    Fetch long notation for the given text (case-insensitively) from the database.
+    Fetch long notation for the given text (case-insensitively) from the in-memory notation index.
     """
-    try:
-        conn = connection(DATABASE_PATH)
-        if conn:
-            with conn:
-                cur = conn.cursor()
-                # Convert text to lowercase for consistent matching
-                normalized_text = rtext.lower()
-                cur.execute("SELECT Long_Notations FROM Keys WHERE LOWER(Short_Notations) = ?", (normalized_text,))
-                row = cur.fetchone()
-                if row:
-                    return row[0]  # Return the long notation if found
-                else:
-                    return rtext  # Return the original text if not found
-    except Error as e:
-        print(f"Database fetch error: {e}")
-        return rtext
+    return notation_index.lookup(rtext)
+
+@metrics.stage_seconds.timed('input_idiom_match')
+def substitute_input_idiom(text):
+    """
+    Replace an idiom typed in Roman Hinglish by its English meaning before translation,
+    which would render it word by word
+    """
+    store = idiomcorpus.load_idioms()
+    if store.variants is None:
+        return text
+    stream = tokenstream.TokenStream.split(text)
+    match = store.variants.match(stream.words, forms=('roman',))
+    if match is None and store.fuzzy is not None:
+        match = store.fuzzy.match(stream.words, forms=('roman',))
+    if match is None:
+        return text
+    last = stream.words[match.last - 1]
+    start = stream.starts[match.first]
+    # Punctuation after the idiom stays
+    end = stream.ends[match.last - 1] - (len(last) - len(last.rstrip(string.punctuation)))
+    return text[:start] + store.english[match.idiom] + text[end:]
 
-def perform_operation():
+def perform_operation(text, stream=None, mode=None, deadline=None, stats=None):
     """
-    Perform idiom conversion
+    Perform idiom conversion (on the token stream of text, if given), followed by the
+    second translation pass in the given mode (RETRANSLATE_MODE by default):
+    'spans' sends only the tokens that still need it, 'full' the whole text, 'off' nothing.
+    Characters sent to translators are added up in stats.
     """
-    global result
+    mode = mode or app.config['RETRANSLATE_MODE']
     try:
         object = idiomcorpus.Idiomcorpus()
-        object.idiom_init(result)
-        object.check_idiom()
-        object.idiom_convert()
-        return object.idiom_display()
+        with metrics.stage_seconds.time('idiom_match'):
+            object.idiom_init(text, stream)
+            object.check_idiom()
+            object.idiom_convert()
+            substituted = object.idiom_substitute()
+        # object.idiom_display() translates the whole text a second time
+        if mode == 'spans':
+            object.output = mtranslate_spans(object.stream, deadline, stats)
+        elif mode == 'full':
+            object.output = mtranslate_text(substituted, deadline, stats)
+        else:
+            object.output = substituted
+        print(object.output)
+        return object.output
     except Exception as e:
         print(f"Idiom conversion error: {e}")
-        return result
+        return text
+
+def guarded_call(backend, func, deadline=None):
+    """
+    Call a translator backend through its circuit breaker, giving up after TRANSLATE_TIMEOUT
+    or when the request's deadline is reached (deadlines.Unavailable). Only errors and calls
+    that ran out of the full TRANSLATE_TIMEOUT count as failures of the backend.
+    """
+    limit = app.config['TRANSLATE_TIMEOUT']
+    timeout = limit if deadline is None else deadline.timeout(limit)
+    return breakers[backend].call(func, timeout, limit)
+
+def count_translated(stats, backend, text):
+    """
+    Add the characters of a successful translator call to the metrics and to the request's stats
+    """
+    metrics.translated_chars_total.inc(backend, amount=len(text))
+    if stats is not None:
+        stats[backend] = stats.get(backend, 0) + len(text)
+
+def skip_stage(deadline, stage):
+    """
+    Record that a network stage of a request did not run, making its result partial
+    """
+    metrics.skipped_stages_total.inc(stage)
+    if deadline is not None:
+        deadline.skip(stage)
 
-def google_translate(text):
+@metrics.stage_seconds.timed('translate')
+def google_translate(text, deadline=None, stats=None):
     """
-    Translate text using Google Translator
+    Translate text using Google Translator, answering repeated texts from the translation cache
     """
+    cached = translations.get(text, dest='en', backend='google')
+    if cached is not None:
+        return cached
     try:
-        translation = translator.translate(text, dest='en')
-        return translation.text
+        translation = guarded_call('google', lambda: resources.translator().translate(text, dest='en'), deadline)
     except Exception as e:
         print(f"Translation error: {e}")
-        return text
+        skip_stage(deadline, 'translate')
+        return offline_translate(text)
+    count_translated(stats, 'google', text)
+    translations.put(text, translation.text, dest='en', backend='google')
+    return translation.text
+
+@metrics.stage_seconds.timed('translate')
+def google_translate_batch(texts, deadline=None):
+    """
+    Translate many texts with as few Google Translator round trips as possible.
+    Returns the translations and the batching stats (calls made, round trips saved,
+    characters translated).
+    """
+    results = [translations.get(text, dest='en', backend='google') for text in texts]
+    misses = [i for i, cached in enumerate(results) if cached is None]
+
+    def translate(text):
+        return guarded_call('google', lambda: resources.translator().translate(text, dest='en').text, deadline)
+
+    translated, stats = batch_translation.translate_batch([texts[i] for i in misses], translate)
+    stats['translated_chars'] = 0
+    failed = set(stats['failed'])
+    for pos, (i, text) in enumerate(zip(misses, translated)):
+        if pos in failed:
+            # Not cached, so the text is sent to Google again next time
+            metrics.skipped_stages_total.inc('translate')
+            results[i] = offline_translate(texts[i])
+        else:
+            results[i] = text
+            translations.put(texts[i], text, dest='en', backend='google')
+            count_translated(None, 'google', texts[i])
+            stats['translated_chars'] += len(texts[i])
+    stats['failed'] = [misses[pos] for pos in sorted(failed)]
+    stats['cached'] = len(texts) - len(misses)
+    return results, stats
+
+@metrics.stage_seconds.timed('offline_translate')
+def offline_translate(text):
+    """
+    Translate text with the local Hinglish lexicon (no network call); also the fallback
+    when the online translators fail
+    """
+    return offline_translation.translate(text)
+
+def translation_engine(name):
+    """
+    Engine a request asked for: the configured default if it names none, None if it is unknown
+    """
+    if not name:
+        return app.config['TRANSLATION_ENGINE']
+    return name if name in TRANSLATION_ENGINES else None
+
+class ConversionPipeline():
+    """
+    State of one conversion request (input, intermediate texts, output and sentiment).
+    Create one per request so that concurrent requests never share data.
+
+    Translator calls share the request's deadline. A network stage that fails or runs
+    out of time is skipped (the Hinglish input goes through the offline lexicon, the
+    second pass is left out) and the result is marked partial.
+    """
+
+    def __init__(self, input_txt='', translated_text=None, engine=None, deadline=None):
+        self.input_txt = input_txt
+        self.translated_text = translated_text
+        self.engine = engine or app.config['TRANSLATION_ENGINE']
+        self.deadline = deadline or deadlines.Deadline(app.config['REQUEST_DEADLINE'])
+        self.expanded_text = ''
+        self.stream = None
+        self.output = ''
+        self.sentiment = None
+        self.sentiment_chart = None
+        # Characters sent to each translator backend
+        self.translated_chars = {}
+
+    @property
+    def partial(self):
+        return self.deadline.partial
+
+    def convert(self):
+        """
+        Translate, expand notations and convert idioms; returns the English text
+        """
+        offline = self.engine == 'offline'
+        if self.translated_text is None:
+            source = substitute_input_idiom(self.input_txt)
+            self.translated_text = (offline_translate(source) if offline
+                                    else google_translate(source, self.deadline, self.translated_chars))
+        # Tokenized once; every stage below edits the same token stream
+        self.stream = tokenstream.TokenStream.tokenize(self.translated_text, word_tokenize)
+        expand_stream(self.stream)
+        spell_check(self.stream)
+        self.expanded_text = self.stream.text()
+        # The offline engine already produced English; a second lexicon pass would
+        # mistranslate English words that are also Hinglish words
+        self.output = perform_operation(self.expanded_text, self.stream, mode='off' if offline else None,
+                                        deadline=self.deadline, stats=self.translated_chars)
+        return self.output
+
+    def analyze(self, chart=True):
+        """
+        Sentiment analysis of the converted text, and its chart unless chart is False
+        """
+        words = None
+        # The idiom stage's tokens still match the output unless the last translation changed it
+        if self.stream is not None and self.output == self.stream.text() and self.stream.is_split():
+            words = tuple(self.stream.words)
+        self.sentiment = analyze_sentiment(self.output, words)
+        if chart:
+            self.sentiment_chart = generate_sentiment_chart(self.output, self.sentiment['polarity'], words)
+        return self.sentiment
 
 def conversion_fun(input_txt):
     """
     Convert input text to English
     """
-    global result
-    global text1
-    global text2
-    
-    text1 = []
-    text2 = []
-    
-    translated_text = google_translate(input_txt)
-    token = word_tokenize(translated_text)
-    
-    for i in token:
-        long_notation = fetch_notations(i)
-        text1.append(long_notation)
+    return ConversionPipeline(input_txt).convert()
 
-    ft = " ".join(text1)
-    token = word_tokenize(ft)
+def conversion_batch(input_txts):
+    """
+    Convert many input texts to English, translating them in batched round trips.
+    Returns the converted texts and the batching stats.
+    """
+    translated_txts, stats = google_translate_batch(input_txts)
+    return [convert_translated(text) for text in translated_txts], stats
 
-    for i in token:
-        text2.append(i if d.check(i) else i)
+@lru_cache(maxsize=4096)
+def notation_tokens(long_notation):
+    """
+    Tokens of a long notation, tokenized once per distinct notation
+    """
+    return tuple(word_tokenize(long_notation))
 
-    ft = " ".join(text2)
-    result = ft
-    
-    return perform_operation()
+@metrics.stage_seconds.timed('notation_lookup')
+def expand_stream(stream):
+    """
+    Replace short notations in a token stream, including those of several tokens, by the
+    tokens of their long notation (one left-to-right pass, longest match first)
+    """
+    runs, replacements = [], []
+    for first, last, long_notation in notation_index.matches(stream.words):
+        if long_notation != ' '.join(stream.words[first:last]):
+            runs.append((first, last))
+            replacements.append(notation_tokens(long_notation))
+    if runs:
+        stream.replace_runs(runs, replacements)
+
+@metrics.stage_seconds.timed('spell_check')
+def spell_check(stream):
+    """
+    Mark the tokens of a stream that are English dictionary words (the text is left as is)
+    """
+    d = resources.dictionary()
+    stream.known = [d.check(word) for word in stream.words]
+
+def expand_notations(translated_text):
+    """
+    Expand short notations and spell-check text that was already translated to English
+    """
+    stream = tokenstream.TokenStream.tokenize(translated_text, word_tokenize)
+    expand_stream(stream)
+    spell_check(stream)
+    return stream.text()
+
+def convert_translated(translated_text):
+    """
+    Expand notations and convert idioms in text that was already translated to English
+    """
+    return ConversionPipeline(translated_text=translated_text).convert()
+
+def mtranslate_call(text, deadline=None, stats=None):
+    """
+    One call to the second translation backend; raises if it fails
+    """
+    translated = guarded_call('mtranslate', lambda: idiomcorpus.translate(text, 'en'), deadline)
+    count_translated(stats, 'mtranslate', text)
+    return translated
+
+@metrics.stage_seconds.timed('mtranslate')
+def mtranslate_text(text, deadline=None, stats=None):
+    """
+    Second translation pass over the whole text, as done by Idiomcorpus.idiom_display
+    """
+    try:
+        return mtranslate_call(text, deadline, stats)
+    except Exception as e:
+        # The text is already in English, so it is kept as it is
+        print(f"Translation error: {e}")
+        skip_stage(deadline, 'mtranslate')
+        return text
+
+def needs_retranslation(stream, pos):
+    """
+    True for the tokens the first translation did not turn into English: idiom meanings
+    substituted since the spell check, and words it did not find in the English dictionary
+    (e.g. left in Hindi). Punctuation and numbers never need it.
+    """
+    return stream.known[pos] is not True and any(char.isalpha() for char in stream.words[pos])
+
+@metrics.stage_seconds.timed('mtranslate')
+def mtranslate_spans(stream, deadline=None, stats=None):
+    """
+    Second translation pass over the runs of tokens that need it only, sent in as few
+    calls as possible; the stream is updated and its text returned
+    """
+    runs = stream.runs(lambda pos: needs_retranslation(stream, pos))
+    if runs:
+        segments = [' '.join(stream.words[first:last]) for first, last in runs]
+        translated, batch_stats = batch_translation.translate_batch(
+            segments, lambda segment: mtranslate_call(segment, deadline, stats))
+        if batch_stats['failed']:
+            skip_stage(deadline, 'mtranslate')
+        stream.replace_runs(runs, [text.split() for text in translated])
+    return stream.text()
+
+def retranslate_paragraph(text, deadline=None):
+    """
+    Second pass of the async pipeline: its paragraphs carry no spell check, so they are
+    translated whole unless RETRANSLATE_MODE is 'off'
+    """
+    if app.config['RETRANSLATE_MODE'] == 'off':
+        return text
+    return mtranslate_text(text, deadline)
+
+# Paragraphs of one request are converted concurrently, with at most
+# TRANSLATE_CONCURRENCY translator calls in flight per request (event loop)
+async_converter = async_pipeline.AsyncPipeline(google_translate, expand_notations, retranslate_paragraph,
+                                               concurrency=app.config['TRANSLATE_CONCURRENCY'],
+                                               timeout=app.config['TRANSLATE_TIMEOUT'])
+
+# Large files are converted in the background by a local process pool
+JOBS_DATABASE_PATH = "jobs.db"
+job_queue = jobs.JobQueue(JOBS_DATABASE_PATH, app.config['JOBS_FOLDER'], conversion_fun,
+                          workers=app.config['JOB_WORKERS'])
+
+@app.before_request
+def start_job_queue():
+    """Start the job workers in this process and resume unfinished jobs (once per process)"""
+    job_queue.start()
+
+# Request counts, latencies and requests in flight for /metrics
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    metrics.in_flight.inc()
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(exc):
+    # Popped: a streamed response (stream_with_context) tears the request down twice
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    metrics.in_flight.dec()
+    endpoint = request.endpoint or 'unknown'
+    status = 500 if exc is not None else g.get('response_status', 500)
+    metrics.request_seconds.observe(endpoint, time.perf_counter() - started)
+    metrics.requests_total.inc(endpoint, status)
+    if status >= 500:
+        metrics.errors_total.inc(endpoint)
+
+# Template rendering is timed through Flask's signals, around every render_template call
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_template_time(sender, template, context, **extra):
+    if 'template_started' in g:
+        metrics.stage_seconds.observe('template_render', time.perf_counter() - g.pop('template_started'))
+
+metrics.register_cache('translation', lambda: (translations.hits, translations.misses))
+def lru_counts(*functions):
+    """
+    (hits, misses) of lru_cache-decorated functions, added up
+    """
+    infos = [function.cache_info() for function in functions]
+    return sum(info.hits for info in infos), sum(info.misses for info in infos)
+
+metrics.register_cache('sentiment', lambda: lru_counts(sentiment.memo_analysis))
+metrics.register_cache('notation_tokens', lambda: lru_counts(notation_tokens))
+
+# Per-request profiling, only wired in when an admin token is configured: a request
+# sending the token in the X-Profile header runs under cProfile and the response names
+# the saved profile in X-Profile-Id. Without a token no hook is installed at all.
+profiler = None
+if app.config['PROFILE_TOKEN']:
+    profiler = profiling.RequestProfiler(app.config['PROFILE_TOKEN'], app.config['PROFILE_FOLDER'])
+
+    @app.before_request
+    def start_profile():
+        if request.endpoint != 'download_profile' and profiler.requested(request.headers.get(profiling.PROFILE_HEADER)):
+            g.profile = profiler.start()
+
+    @app.after_request
+    def save_profile(response):
+        if 'profile' in g:
+            response.headers[profiling.PROFILE_ID_HEADER] = profiler.save(g.pop('profile'), request.endpoint or 'unknown')
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # A request that raised never reached save_profile
+        if 'profile' in g:
+            g.pop('profile').disable()
+
+@app.route("/profiles/<name>", methods=['GET'])
+def download_profile(name):
+    """
+    Download a saved request profile (requires the admin token in the X-Profile header)
+    """
+    if profiler is None or not profiler.requested(request.headers.get(profiling.PROFILE_HEADER)):
+        return jsonify({'error': 'Unknown profile'}), 404
+    path = profiler.path(name)
+    if path is None:
+        return jsonify({'error': 'Unknown profile'}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=name)
+
+@app.route("/metrics", methods=['GET'])
+def metrics_page():
+    """
+    Metrics of this process in the Prometheus text format
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 # Root page of the application (landing page)
 @app.route("/", methods=['GET']) 
@@ -262,44 +590,181 @@ def radio_check():
     """
     Check for the input method and process accordingly
     """
-    global result
-    global text1
-    global text2 
-    global sentiment_result
-    
     option1 = request.form.get('radiobtn')
+    engine = translation_engine(request.form.get('engine'))
+    if engine is None:
+        return render_template("home_page.html", error="Unknown translation engine")
     
     try:
         if option1 == '1':  # Keyboard input
-            a = keyboard_ip()
+            t = keyboard_ip()
         elif option1 == '2':  # Voice input
             t = request.form.get('text3', '')
-            a = conversion_fun(t)
         elif option1 == '3':  # File input
-            a = file_ip()
+            t = file_ip()
         else:
             return render_template("home_page.html", error="Invalid input method")
         
-        # Perform sentiment analysis on the converted text
-        sentiment_result = analyze_sentiment(a)
+        # All state of this request lives in its own pipeline object
+        pipeline = ConversionPipeline(t, engine=engine)
+        a = pipeline.convert()
         
-        # Generate sentiment chart (pass both text and polarity)
-        sentiment_chart = generate_sentiment_chart(a, sentiment_result['polarity'])
-        
-        text1 = []
-        text2 = []
+        # Perform sentiment analysis and generate the sentiment chart on the converted text
+        sentiment_result = pipeline.analyze()
         
         return render_template("home_page.html", 
                                etext=a, 
                                sentiment=sentiment_result['sentiment'], 
                                polarity=sentiment_result['polarity'],
                                emoji=sentiment_result['emoji'],
-                               sentiment_chart=sentiment_chart)
+                               sentiment_chart=pipeline.sentiment_chart,
+                               partial=pipeline.partial)
     
     except Exception as e:
         print(f"Error in radio_check: {e}")
         return render_template("home_page.html", error="An error occurred during processing")
     
+@app.route("/api/convert", methods=['POST'])
+def api_convert():
+    """
+    Convert a batch of texts for machine clients.
+
+    Request body: {"texts": [...], "sentiment": false, "chart": false, "engine": "google"}
+    ("engine": "offline" translates with the local Hinglish lexicon, without network calls)
+    Response: {"results": [...], "translator_calls": n, "translated_chars": {backend: n}} with one entry per text, either
+    {"etext": ..., "partial": false} (plus sentiment fields and the chart JSON if requested)
+    or {"error": ...}. A partial result lists the network stages it "skipped" (deadline
+    reached or translator unavailable).
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('texts'), list):
+        return jsonify({'error': 'Expected a JSON object with a "texts" array'}), 400
+    texts = data['texts']
+    want_chart = bool(data.get('chart', False))
+    want_sentiment = bool(data.get('sentiment', False)) or want_chart
+    engine = translation_engine(data.get('engine'))
+    if engine is None:
+        return jsonify({'error': f'"engine" must be one of {", ".join(TRANSLATION_ENGINES)}'}), 400
+
+    valid = [i for i, text in enumerate(texts) if isinstance(text, str)]
+    deadline = deadlines.Deadline(app.config['REQUEST_DEADLINE'])
+    if engine == 'offline':
+        translated, stats = [offline_translate(texts[i]) for i in valid], {'calls': 0, 'failed': [], 'translated_chars': 0}
+    else:
+        translated, stats = google_translate_batch([texts[i] for i in valid], deadline)
+    failed = {valid[pos] for pos in stats['failed']}
+    translated = dict(zip(valid, translated))
+    translated_chars = {'google': stats['translated_chars']}
+
+    results = []
+    for i, text in enumerate(texts):
+        if i not in translated:
+            results.append({'error': 'Text must be a string'})
+            continue
+        try:
+            # Every text has its own record of skipped stages, within the request's deadline
+            pipeline = ConversionPipeline(text, translated_text=translated[i], engine=engine,
+                                          deadline=deadline.share())
+            if i in failed:
+                pipeline.deadline.skip('translate')
+            item = {'etext': pipeline.convert(), 'partial': pipeline.partial}
+            for backend, chars in pipeline.translated_chars.items():
+                translated_chars[backend] = translated_chars.get(backend, 0) + chars
+            if pipeline.partial:
+                item['skipped'] = pipeline.deadline.skipped
+            if want_sentiment:
+                item.update(pipeline.analyze(chart=want_chart))
+                if want_chart:
+                    item['chart'] = pipeline.sentiment_chart
+        except Exception as e:
+            print(f"Error in api_convert: {e}")
+            item = {'error': 'An error occurred during processing'}
+        results.append(item)
+
+    return jsonify({'results': results, 'translator_calls': stats['calls'], 'translated_chars': translated_chars})
+
+@app.route("/api/convert_file", methods=['POST'])
+def api_convert_file():
+    """
+    Convert a text file sent as the raw request body, paragraph by paragraph,
+    and stream the result back.
+
+    The body is read in chunks straight from the request and each paragraph is
+    sent back as soon as it is converted, so memory use does not grow with the
+    file size. Multipart uploads are refused: they are spooled to a temporary
+    file before the view runs and closed before the response is streamed.
+    """
+    if request.mimetype == 'multipart/form-data':
+        return jsonify({'error': 'Send the file as the raw request body (Content-Type: text/plain)'}), 415
+
+    @stream_with_context
+    def generate():
+        paragraphs = streaming.read_paragraphs(request.stream)
+        yield from streaming.convert_paragraphs(paragraphs, conversion_fun)
+
+    return Response(generate(), mimetype='text/plain')
+
+@app.route("/jobs", methods=['POST'])
+def create_job():
+    """
+    Queue a file for background conversion; the file is the "myfile" part of a
+    multipart form or the raw request body. Returns the job id and its status URL.
+    """
+    if request.mimetype == 'multipart/form-data':
+        file = request.files.get('myfile')
+        if file is None or not allowed_file(file.filename):
+            return jsonify({'error': 'Expected a .txt file in the "myfile" field'}), 400
+        stream = file.stream
+    else:
+        stream = request.stream
+    job_id = job_queue.submit(stream)
+    return jsonify({'id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+
+@app.route("/jobs/<job_id>", methods=['GET'])
+def job_status(job_id):
+    """
+    Report the status and progress of a background conversion
+    """
+    job = job_queue.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    job['progress'] = round(job['done'] / job['total'] * 100, 1) if job['total'] else 0.0
+    if job['status'] == 'done':
+        job['result_url'] = url_for('job_result', job_id=job_id)
+    return jsonify(job)
+
+@app.route("/jobs/<job_id>/result", methods=['GET'])
+def job_result(job_id):
+    """
+    Download the converted text of a finished background conversion
+    """
+    job = job_queue.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': f"Job is {job['status']}"}), 409
+    return send_file(job_queue.result_path(job_id), mimetype='text/plain', as_attachment=True,
+                     download_name=f'{job_id}.txt')
+
+@app.route("/api/convert_async", methods=['POST'])
+async def convert_async():
+    """
+    Convert text to English, translating its paragraphs concurrently
+    (the offline engine makes no network calls, so it converts the text directly)
+    """
+    data = request.get_json(silent=True) or request.form
+    engine = translation_engine(data.get('engine'))
+    if engine is None:
+        return jsonify({'error': f'"engine" must be one of {", ".join(TRANSLATION_ENGINES)}'}), 400
+    if engine == 'offline':
+        return jsonify({'etext': ConversionPipeline(data.get('text', ''), engine=engine).convert(), 'partial': False})
+    deadline = deadlines.Deadline(app.config['REQUEST_DEADLINE'])
+    etext = await async_converter.convert(data.get('text', ''), deadline)
+    result = {'etext': etext, 'partial': deadline.partial}
+    if deadline.partial:
+        result['skipped'] = deadline.skipped
+    return jsonify(result)
+
 @app.route("/about_page")
 def about_page():
     """Open about page"""
@@ -312,13 +777,10 @@ def help_page():
 
 def keyboard_ip():
     """Take input through keyboard"""
-    user_ip = request.form.get('hinglish', '')
-    return conversion_fun(user_ip)
+    return request.form.get('hinglish', '')
 
 def file_ip():
     """Take file as input from the user"""
-    global file_content
-    
     if 'myfile' not in request.files:
         raise ValueError("No file part")
     
@@ -328,15 +790,10 @@ def file_ip():
         raise ValueError("No selected file")
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
+        # Read the upload directly: a file saved under its own name in the shared
+        # upload folder could be overwritten or deleted by a concurrent request
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                file_content = f.read()
-            os.remove(file_path)
-            return conversion_fun(file_content)
+            return file.read().decode('utf-8')
         except Exception as e:
             print(f"File reading error: {e}")
             raise
@@ -0,0 +1,128 @@
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import idiomcorpus
+
+# Translator calls in flight at the same time
+TRANSLATE_CONCURRENCY = 8
+
+# Seconds before a single translator call is abandoned
+TRANSLATE_TIMEOUT = 10.0
+
+# Abandoned translator calls that may still be running (each holds a thread) before
+# new calls are refused instead of queueing behind them
+MAX_ABANDONED = 8
+
+
+class AsyncPipeline():
+    """
+    Asynchronous version of the conversion pipeline.
+
+    The text is split into paragraphs that are converted concurrently: the blocking
+    `translate` (Hinglish -> English) and `retranslate` (second pass after idiom
+    conversion) calls run on a thread pool, at most `concurrency` at a time per event
+    loop, and each call is abandoned after `timeout` seconds. An abandoned call keeps
+    its thread until it returns: the pool has `max_abandoned` threads on top of
+    `concurrency` for them, and while that many are still running new calls are
+    refused. A call that fails, times out or is refused leaves its text untranslated,
+    as google_translate does. `expand` is the local notation expansion stage.
+
+    Given a request deadline, no call outlives it: the callables are passed
+    deadline=... as well, and a call that cannot finish in time is recorded as a
+    skipped stage of the request.
+    """
+
+    def __init__(self, translate, expand, retranslate,
+                 concurrency=TRANSLATE_CONCURRENCY, timeout=TRANSLATE_TIMEOUT, max_abandoned=MAX_ABANDONED):
+        self.translate = translate
+        self.expand = expand
+        self.retranslate = retranslate
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_abandoned = max_abandoned
+        self.abandoned = 0
+        self.lock = threading.Lock()
+        # An asyncio semaphore belongs to the event loop that first uses it: one per loop
+        self.semaphores = weakref.WeakKeyDictionary()
+        # Shared by every event loop of the process
+        self.executor = ThreadPoolExecutor(max_workers=concurrency + max_abandoned, thread_name_prefix='translate')
+
+    def semaphore(self):
+        """
+        The running event loop's semaphore
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            semaphore = self.semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self.semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return semaphore
+
+    def abandon(self, future):
+        """
+        Count a timed-out call as abandoned until its thread returns
+        """
+        with self.lock:
+            if future.done():
+                return
+            self.abandoned += 1
+        future.add_done_callback(self.returned)
+
+    def returned(self, future):
+        with self.lock:
+            self.abandoned -= 1
+
+    async def call(self, func, text, deadline=None, stage=None):
+        """
+        Run one blocking translator call under the loop's semaphore and the per-call timeout
+        """
+        async with self.semaphore():
+            timeout = self.timeout
+            if self.abandoned >= self.max_abandoned:
+                print(f"Translation refused: {self.abandoned} abandoned calls still running")
+            else:
+                try:
+                    if deadline is not None:
+                        timeout = deadline.timeout(timeout)
+                        func = functools.partial(func, deadline=deadline)
+                    future = self.executor.submit(func, text)
+                    try:
+                        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+                    except asyncio.TimeoutError:
+                        # Cancelled if it had not started yet, abandoned otherwise
+                        self.abandon(future)
+                        raise
+                except asyncio.TimeoutError:
+                    print(f"Translation timeout after {timeout:.2f}s")
+                except Exception as e:
+                    print(f"Translation error: {e}")
+            if deadline is not None:
+                deadline.skip(stage)
+            return text
+
+    async def convert_paragraph(self, paragraph, deadline=None):
+        if not paragraph.strip():
+            return paragraph
+        translated = await self.call(self.translate, paragraph, deadline, 'translate')
+        expanded = self.expand(translated)
+        try:
+            corpus = idiomcorpus.Idiomcorpus()
+            corpus.idiom_init(expanded)
+            corpus.check_idiom()
+            corpus.idiom_convert()
+            substituted = corpus.idiom_substitute()
+        except Exception as e:
+            print(f"Idiom conversion error: {e}")
+            return expanded
+        return await self.call(self.retranslate, substituted, deadline, 'mtranslate')
+
+    async def convert(self, text, deadline=None):
+        """
+        Convert text to English, one concurrent task per paragraph
+        """
+        paragraphs = text.split('\n')
+        results = await asyncio.gather(*(self.convert_paragraph(paragraph, deadline) for paragraph in paragraphs))
+        return '\n'.join(results)
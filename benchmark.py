@@ -0,0 +1,1762 @@
+"""
+Micro-benchmarks for the local stages of the converter.
+
+Usage: python benchmark.py <name> [<name> ...]
+       python benchmark.py stages --save-baseline      (record the per-stage baseline)
+       python benchmark.py stages --require-baseline   (fail when there is no baseline)
+
+Every named benchmark runs; the exit status is non-zero if any of them failed.
+"""
+import argparse
+import asyncio
+import contextlib
+import copy
+import functools
+import http.server
+import io
+import json
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
+import urllib.request
+
+import async_pipeline
+import batch_translation
+import chart
+import compiled_dictionaries
+import deadlines
+import fuzzy_idioms
+import idiom_index
+import idiomcorpus
+import jobs
+import metrics
+import notations
+import offline_translation
+import sentiment
+import streaming
+import tokenstream
+import translation_cache
+
+DATABASE_PATH = "Database.db"
+SAMPLE_PATH = "hinglish-n.txt"
+IDIOMS_PATH = "idioms.txt"
+DEVNULL = open(os.devnull, "w")
+
+
+def quiet():
+    """
+    Keep the pipeline's debug prints out of the benchmark output
+    """
+    return contextlib.redirect_stdout(DEVNULL)
+
+
+def timeit(func, repeat=5):
+    """
+    Run func `repeat` times and return the best wall-clock time in seconds
+    """
+    best = None
+    for _ in range(repeat):
+        with quiet():
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def sample_tokens(count):
+    """
+    Build a list of `count` tokens from the sample Hinglish text
+    """
+    with open(SAMPLE_PATH, encoding="utf-8") as f:
+        words = f.read().split()
+    return (words * (count // len(words) + 1))[:count]
+
+
+def sqlite_fetch_notations(rtext):
+    """
+    Per-token lookup as it was done before the in-memory index
+    """
+    conn = sqlite3.connect(DATABASE_PATH)
+    with conn:
+        cur = conn.cursor()
+        cur.execute("SELECT Long_Notations FROM Keys WHERE LOWER(Short_Notations) = ?", (rtext.lower(),))
+        row = cur.fetchone()
+    conn.close()
+    return row[0] if row else rtext
+
+
+def bench_notations():
+    """
+    Per-token notation lookup: one SQLite connection per token vs the in-memory index
+    """
+    tokens = sample_tokens(2000)
+    index = notations.NotationIndex(DATABASE_PATH)
+
+    assert [sqlite_fetch_notations(t) for t in tokens] == [index.lookup(t) for t in tokens]
+
+    before = timeit(lambda: [sqlite_fetch_notations(t) for t in tokens], repeat=3)
+    after = timeit(lambda: [index.lookup(t) for t in tokens])
+    print(f"notations: {len(index)} entries, {len(tokens)} tokens")
+    print(f"  sqlite per token : {before / len(tokens) * 1e6:10.2f} us/token")
+    print(f"  in-memory index  : {after / len(tokens) * 1e6:10.2f} us/token")
+    print(f"  speedup          : {before / after:10.1f}x")
+
+
+# Notation table sizes for the expansion benchmark
+EXPANSION_SIZES = (1000, 10000, 100000, 200000)
+
+
+def synthetic_notations(count, seed=0):
+    """
+    The notation table padded with random short forms of one to three tokens
+    """
+    conn = sqlite3.connect(DATABASE_PATH)
+    rows = conn.execute("SELECT Short_Notations, Long_Notations FROM Keys ORDER BY rowid").fetchall()
+    conn.close()
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    while len(rows) < count:
+        short = ' '.join(''.join(rng.choice(letters) for _ in range(rng.randint(2, 5)))
+                         for _ in range(rng.choice((1, 1, 1, 2, 3))))
+        rows.append((short, short.upper()))
+    return rows[:count]
+
+
+def dict_matches(table, longest, words):
+    """
+    Longest match with a dict of token tuples: every length up to the longest short form
+    is tried at every position
+    """
+    matches, pos = [], 0
+    while pos < len(words):
+        for end in range(min(len(words), pos + longest), pos, -1):
+            long = table.get(tuple(word.lower() for word in words[pos:end]))
+            if long is not None:
+                matches.append((pos, end, long))
+                pos = end
+                break
+        else:
+            pos += 1
+    return matches
+
+
+def bench_expansion():
+    """
+    Notation expansion in one longest-match pass over the tokens: latency as the table grows
+    to 200k short forms, against a dict probed with every n-gram, plus build time and memory
+    """
+    words = sample_tokens(20000)
+    print(f"expansion: {len(words)} tokens, longest match over tables of growing size")
+    for count in EXPANSION_SIZES:
+        rows = synthetic_notations(count)
+        build = timeit(lambda: notations.NotationTrie(rows), repeat=1)
+        tracemalloc.start()
+        trie = notations.NotationTrie(rows)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        table = {}
+        for short, long in rows:
+            table.setdefault(tuple(short.lower().split()), long)
+        longest = max(len(key) for key in table)
+        assert trie.matches(words) == dict_matches(table, longest, words)
+        elapsed = timeit(lambda: trie.matches(words))
+        probes = timeit(lambda: dict_matches(table, longest, words))
+        print(f"  {count:7d} forms   : trie {elapsed / len(words) * 1e6:6.2f} us/token, "
+              f"n-gram dict {probes / len(words) * 1e6:6.2f} us/token, "
+              f"built in {build * 1e3:7.1f} ms, {memory / 2 ** 20:6.1f} MiB")
+    with quiet():
+        import app
+
+        stream = tokenstream.TokenStream.tokenize(' '.join(words[:2000]), app.word_tokenize)
+        app.notation_index.notation_trie()
+        elapsed = timeit(lambda: app.expand_stream(copy.deepcopy(stream)))
+        copying = timeit(lambda: copy.deepcopy(stream))
+    print(f"  expand_stream    : {(elapsed - copying) / len(stream) * 1e6:6.2f} us/token "
+          f"({len(app.notation_index.notation_trie())} short forms)")
+
+
+def heap_after(func):
+    """
+    Python heap memory still allocated by what func() returns
+    """
+    tracemalloc.start()
+    result = func()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return memory
+
+
+def bench_dictionaries():
+    """
+    Loading the notations and idioms: the database and idioms.txt read into dicts vs the
+    memory-mapped compiled dictionaries (checksum and source check included), then the
+    same with 100k notations
+    """
+    import tempfile
+
+    def parse():
+        return notations.NotationIndex(DATABASE_PATH), idiomcorpus.IdiomStore.from_file(IDIOMS_PATH)
+
+    def mapped():
+        return compiled_dictionaries.load(sources=compiled_dictionaries.source_digests())
+
+    tokens = sample_tokens(2000)
+    index, dictionaries = notations.NotationIndex(DATABASE_PATH), mapped()
+    assert dictionaries is not None, "run: python compiled_dictionaries.py"
+    assert [index.lookup(t) for t in tokens] == [dictionaries.notations.get(t.lower(), t) for t in tokens]
+    before, after = timeit(parse), timeit(mapped)
+    print(f"dictionaries: {len(dictionaries.notations)} notations, {len(dictionaries.idioms)} idioms, "
+          f"{len(dictionaries.mapping)} bytes")
+    print(f"  database + txt   : {before * 1e3:8.2f} ms to load, {heap_after(parse) / 2 ** 10:8.1f} KB of heap")
+    print(f"  compiled, mapped : {after * 1e3:8.2f} ms to load, {heap_after(mapped) / 2 ** 10:8.1f} KB of heap")
+    lookup = timeit(lambda: [index.lookup(t) for t in tokens])
+    table = timeit(lambda: [dictionaries.notations.get(t.lower(), t) for t in tokens])
+    compiled = notations.NotationIndex(DATABASE_PATH, dictionaries_file=compiled_dictionaries.DICTIONARIES_PATH)
+    cached = timeit(lambda: [compiled.lookup(t) for t in tokens])
+    print(f"  lookup, dict     : {lookup / len(tokens) * 1e6:8.2f} us/token")
+    print(f"  lookup, mapped   : {table / len(tokens) * 1e6:8.2f} us/token (binary search)")
+    print(f"  NotationIndex    : {cached / len(tokens) * 1e6:8.2f} us/token (mapped, lookups cached)")
+
+    rows = synthetic_notations(100000)
+    idioms = list(dictionaries.idioms)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "dictionaries.bin")
+        build = timeit(lambda: compiled_dictionaries.write(path, rows, idioms, {}), repeat=1)
+        large = compiled_dictionaries.load(path)
+        load = timeit(lambda: compiled_dictionaries.load(path))
+        folded = {}
+        for short, long in rows:
+            folded.setdefault(short.lower(), long)
+        keys = list(folded)[::50]
+        assert [large.notations.get(key) for key in keys] == [folded[key] for key in keys]
+        elapsed = timeit(lambda: [large.notations.get(key) for key in keys])
+        print(f"  100k notations   : {len(large.mapping) / 2 ** 20:8.2f} MiB, built in {build * 1e3:.0f} ms, "
+              f"loaded in {load * 1e3:.2f} ms, {heap_after(lambda: compiled_dictionaries.load(path)) / 2 ** 10:.1f} KB "
+              f"of heap, lookup {elapsed / len(keys) * 1e6:.2f} us")
+        del large
+
+        # A missing or stale file is rebuilt from the CSV, also when the CSV is edited under a running index
+        path, csv_path = os.path.join(directory, "dictionaries.bin"), os.path.join(directory, "notations.csv")
+        with open(compiled_dictionaries.NOTATIONS_CSV_PATH, 'rb') as fin, open(csv_path, 'wb') as fout:
+            fout.write(fin.read())
+        with quiet():
+            fresh = notations.NotationIndex(DATABASE_PATH, check_interval=0, dictionaries_file=path,
+                                            notations_file=csv_path)
+            assert fresh.dictionaries is not None
+            assert [fresh.lookup(t) for t in tokens] == [index.lookup(t) for t in tokens]
+            with open(csv_path, 'a', encoding='utf-8') as f:
+                f.write("zzqx,edited notation\n")
+            started = time.perf_counter()
+            assert fresh.lookup("zzqx") == "edited notation" and fresh.dictionaries is not None
+            reload = time.perf_counter() - started
+            mtime = os.path.getmtime(path)
+            assert fresh.lookup("zzqx") == "edited notation" and os.path.getmtime(path) == mtime
+            # Unusable files are unmapped again
+            assert compiled_dictionaries.load(path, {'notations': 'other'}) is None
+            with open(path, 'r+b') as f:
+                f.truncate(compiled_dictionaries.HEADER.size)
+            assert compiled_dictionaries.load(path) is None
+        print(f"  edited CSV       : rebuilt and mapped again in {reload * 1e3:.1f} ms")
+
+
+def linear_check_idiom(corpus, sentence):
+    """
+    check_idiom as it was done before the inverted index: score every idiom in turn
+    """
+    unicount, uniidiom = 0, ''
+    inputtoken = list(set(corpus.idiom_tokenize(sentence)))
+    for idiom in corpus.hindi:
+        idiomtoken = list(set(corpus.idiom_tokenize(idiom)))
+        counter = corpus.idiom_match(inputtoken, idiomtoken)
+        if counter > unicount and len(idiomtoken) <= len(inputtoken):
+            unicount = counter
+            uniidiom = idiom
+    return uniidiom
+
+
+def synthetic_idioms(count, seed=0):
+    """
+    Real idioms from idioms.txt padded with random idioms built from the same vocabulary
+    """
+    with open(IDIOMS_PATH, encoding="utf-8") as f:
+        real = [line.split('-')[0].strip() for line in f if line.strip()]
+    vocabulary = sorted({word for idiom in real for word in idiom.split()})
+    rng = random.Random(seed)
+    idioms = real[:count]
+    while len(idioms) < count:
+        idioms.append(' '.join(rng.choice(vocabulary) for _ in range(rng.randint(3, 8))))
+    return idioms
+
+
+def bench_idioms():
+    """
+    Idiom matching: linear scan over the corpus vs the token -> idiom inverted index
+    """
+    rng = random.Random(1)
+    for size in (470, 5000, 50000):
+        idioms = synthetic_idioms(size)
+        store = idiomcorpus.IdiomStore(idioms, idioms)
+        corpus = idiomcorpus.Idiomcorpus(store)
+        sentences = [rng.choice(idioms) + ' ' + ' '.join(sample_tokens(rng.randint(5, 30))) for _ in range(20)]
+
+        def indexed():
+            results = []
+            for sentence in sentences:
+                corpus.idiom_init(sentence)
+                results.append(corpus.check_idiom())
+            return results
+        with quiet():
+            assert [linear_check_idiom(corpus, s) for s in sentences] == indexed()
+        build = timeit(lambda: idiomcorpus.IdiomIndex(idioms, corpus.idiom_tokenize), repeat=1)
+        before = timeit(lambda: [linear_check_idiom(corpus, s) for s in sentences], repeat=1)
+        after = timeit(indexed)
+        print(f"idioms: corpus of {size} idioms (index build {build * 1e3:.1f} ms)")
+        print(f"  linear scan      : {before / len(sentences) * 1e3:10.3f} ms/sentence")
+        print(f"  inverted index   : {after / len(sentences) * 1e3:10.3f} ms/sentence")
+        print(f"  speedup          : {before / after:10.1f}x")
+
+
+# ITRANS spellings and how they are usually typed in Roman Hinglish
+TYPED_SPELLINGS = [('.Dh', 'dh'), ('.D', 'd'), ('.N', 'n'), ('~n', 'n'), ('R^i', 'ri'), ('Ch', 'chh'),
+                   ('A', 'aa'), ('I', 'ee'), ('U', 'oo'), ('M', 'n'), ('H', 'h')]
+
+
+def typed_roman(idiom):
+    """
+    A Devanagari idiom as someone would type it in Roman Hinglish (ITRANS with its
+    capitals and dots spelled out, final inherent a dropped)
+    """
+    import resources
+
+    sanscript = resources.load_module('indic_transliteration.sanscript')
+    words = []
+    for word in sanscript.transliterate(idiom, sanscript.DEVANAGARI, sanscript.ITRANS).split():
+        for itrans, typed in TYPED_SPELLINGS:
+            word = word.replace(itrans, typed)
+        word = ''.join(char for char in word.lower() if char.isalpha())
+        if len(word) > 3 and word.endswith('a') and word[-2] not in 'aeiou':
+            word = word[:-1]
+        words.append(word)
+    return ' '.join(words)
+
+
+def bench_variants():
+    """
+    Idioms typed in Roman Hinglish inside Hinglish sentences: recall and latency of the
+    variant index (one probe per token), false matches on idiom-free sentences, and
+    loading the prebuilt index vs building it
+    """
+    store = idiomcorpus.load_idioms()
+    rng = random.Random(8)
+    positions = rng.sample(range(len(store.hindi)), 200)
+    sentences = []
+    for pos in positions:
+        padding = sample_tokens(rng.randint(4, 20))
+        cut = rng.randint(0, len(padding))
+        sentences.append(padding[:cut] + typed_roman(store.hindi[pos]).split() + padding[cut:])
+    words = sample_tokens(20000)
+    plain = [words[i:i + 15] for i in range(0, len(words), 15)]
+
+    index = store.variants
+    with quiet():
+        matches = [index.match(sentence, forms=('roman',)) for sentence in sentences]
+        # Several idioms can share a Devanagari text (with different meanings)
+        found = sum(1 for pos, match in zip(positions, matches)
+                    if match is not None and store.hindi[match.idiom] == store.hindi[pos])
+        false = sum(1 for sentence in plain if index.match(sentence) is not None)
+        elapsed = timeit(lambda: [index.match(sentence) for sentence in sentences])
+        linear = timeit(lambda: [linear_check_idiom(idiomcorpus.Idiomcorpus(store), ' '.join(sentence))
+                                 for sentence in sentences], repeat=1)
+        path = idiom_index.index_path(IDIOMS_PATH)
+        source = idiom_index.source_digest(IDIOMS_PATH)
+        load = timeit(lambda: idiom_index.VariantIndex.load(path, source))
+        build = timeit(lambda: idiom_index.VariantIndex.build(store.hindi, store.english), repeat=1)
+    tokens = sum(len(sentence) for sentence in sentences)
+    print(f"variants: {len(index)} Roman and English forms of {len(store.hindi)} idioms")
+    print(f"  recall           : {found / len(sentences):10.1%} of {len(sentences)} typed Roman idioms")
+    print(f"  false matches    : {false:10d} in {len(plain)} idiom-free sentences")
+    print(f"  variant index    : {elapsed / tokens * 1e6:10.2f} us/token")
+    print(f"  linear scan      : {linear / tokens * 1e6:10.2f} us/token (Devanagari keys only, finds none)")
+    print(f"  load prebuilt    : {load * 1e3:10.2f} ms (build at start-up: {build * 1e3:.1f} ms)")
+
+
+# Typed endings changed by inflection (gender, number, tense), tried in this order
+INFLECTIONS = [('na', 'ne'), ('a', 'e'), ('i', 'e'), ('e', 'i')]
+
+
+def misspell(word, rng):
+    """
+    One typo in a word: a letter dropped, doubled, swapped with the next or a vowel changed
+    """
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return word[:i] + word[i + 1:]
+    if kind == 1:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == 2:
+        return word[:i] + word[i] + word[i:]
+    return word[:i] + rng.choice('aeiou') + word[i + 1:]
+
+
+def inflect(word):
+    for ending, inflected in INFLECTIONS:
+        if word.endswith(ending):
+            return word[:-len(ending)] + inflected
+    return word
+
+
+# Start of an idiom's English gloss, and a sentence using it with an inflected, correctly spelled word
+INFLECTED_ENGLISH = [
+    ("paddle own canoe", "my friends paddled their own canoes"),
+    ("the shirt is nearer", "the shirts are nearer than the coats"),
+    ("necessity is the mother", "necessity was the mother of inventions"),
+    ("one lie leads", "one lie led to another"),
+    ("when the old cock crows", "when the old cock crowed the young cock learned it too"),
+]
+
+
+def bench_fuzzy():
+    """
+    Idioms typed in Roman Hinglish with typos and an inflected last word: recall and latency
+    of the MinHash/LSH index vs scoring every idiom form (brute force) and the exact variant index
+    """
+    store = idiomcorpus.load_idioms()
+    rng = random.Random(3)
+    positions = [pos for pos in rng.sample(range(len(store.hindi)), 300)
+                 if len(idiom_index.form_keys(typed_roman(store.hindi[pos]).split())) >= fuzzy_idioms.MIN_WORDS][:200]
+    sentences = []
+    for pos in positions:
+        typed = [misspell(word, rng) if rng.random() < 0.4 else word for word in typed_roman(store.hindi[pos]).split()]
+        typed[-1] = inflect(typed[-1])
+        padding = sample_tokens(rng.randint(4, 20))
+        cut = rng.randint(0, len(padding))
+        sentences.append(padding[:cut] + typed + padding[cut:])
+    words = sample_tokens(20000)
+    plain = [words[i:i + 15] for i in range(0, len(words), 15)]
+
+    fuzzy = store.fuzzy
+    build = timeit(lambda: fuzzy_idioms.FuzzyIdiomIndex(store.variants), repeat=1)
+    matchers = [
+        ('exact variants', lambda sentence: store.variants.match(sentence, forms=('roman',))),
+        ('LSH', lambda sentence: fuzzy.match(sentence, forms=('roman',))),
+        ('brute force', lambda sentence: next(iter(fuzzy.brute_force(sentence, forms=('roman',))), None)),
+    ]
+    print(f"fuzzy: {len(fuzzy)} forms in {len(fuzzy.buckets)} LSH buckets "
+          f"({fuzzy_idioms.BANDS} bands of {fuzzy_idioms.ROWS}), built in {build * 1e3:.1f} ms")
+    for name, match in matchers:
+        with quiet():
+            matches = [match(sentence) for sentence in sentences]
+            # Several idioms can share a Devanagari text (with different meanings)
+            found = sum(1 for pos, hit in zip(positions, matches)
+                        if hit is not None and store.hindi[hit.idiom] == store.hindi[pos])
+            elapsed = timeit(lambda: [match(sentence) for sentence in sentences],
+                             repeat=1 if name == 'brute force' else 5)
+        print(f"  {name:15s}: recall {found / len(sentences):6.1%} of {len(sentences)} misspelled idioms, "
+              f"{elapsed / len(sentences) * 1e3:8.3f} ms/sentence")
+    false = sum(1 for sentence in plain if fuzzy.match(sentence) is not None)
+    elapsed = timeit(lambda: [fuzzy.match(sentence) for sentence in plain])
+    print(f"  false matches  : {false:6d} in {len(plain)} idiom-free sentences "
+          f"({elapsed / len(plain) * 1e3:.3f} ms/sentence, threshold {fuzzy_idioms.THRESHOLD})")
+
+    # Correctly spelled English idioms with an inflected word pass the spell check, and
+    # must still be found by the idiom stage after translation
+    corpus = idiomcorpus.Idiomcorpus(store)
+    for gloss, sentence in INFLECTED_ENGLISH:
+        expected = {english for english in store.english if english.lower().startswith(gloss)}
+        stream = tokenstream.TokenStream.split(sentence)
+        stream.known = [True] * len(stream.words)
+        assert store.variants.match(stream.words) is None, sentence
+        with quiet():
+            corpus.idiom_init(sentence, stream)
+            corpus.check_idiom()
+        assert corpus.match is not None and store.english[corpus.match.idiom] in expected, (sentence, corpus.match)
+    print(f"  inflected English: {len(INFLECTED_ENGLISH)} spell-checked sentences, all matched (none exactly)")
+
+
+class StubTranslator():
+    """
+    Local stand-in for a translation backend: upper-cases text, counts calls and enforces a size limit
+    """
+
+    def __init__(self, max_chars=batch_translation.MAX_BATCH_CHARS, latency=0.0):
+        self.max_chars = max_chars
+        self.latency = latency
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        if len(text) > self.max_chars:
+            raise ValueError(f"text of {len(text)} characters exceeds the {self.max_chars} limit")
+        if self.latency:
+            time.sleep(self.latency)
+        return text.upper()
+
+
+def bench_batch():
+    """
+    Batched translation: one translator call per document vs packed batches, against a stub translator
+    """
+    rng = random.Random(2)
+    documents = ['\n'.join(' '.join(sample_tokens(rng.randint(5, 60))) for _ in range(rng.randint(1, 4)))
+                 for _ in range(200)]
+    documents[3] = ''
+    documents[7] = 'ek\n\n  \ndo'
+
+    stub = StubTranslator(latency=0.002)
+    with quiet():
+        translated, stats = batch_translation.translate_batch(documents, stub)
+    assert translated == [document.upper() for document in documents]
+    assert stub.calls == stats['calls'] and not stats['failed']
+
+    # A translator that sometimes drops the line breaks forces a per-segment retry
+    def flaky(text):
+        reply = stub(text)
+        return reply.replace('\n', ' ') if stub.calls % 3 == 0 else reply
+
+    with quiet():
+        translated_flaky, flaky_stats = batch_translation.translate_batch(documents, flaky)
+    assert translated_flaky == translated
+
+    per_document = timeit(lambda: [stub(document) for document in documents], repeat=1)
+    batched = timeit(lambda: batch_translation.translate_batch(documents, stub), repeat=1)
+    print(f"batch: {len(documents)} documents, {stats['segments']} segments")
+    print(f"  per document     : {len(documents):6d} calls {per_document * 1e3:10.1f} ms")
+    print(f"  batched          : {stats['calls']:6d} calls {batched * 1e3:10.1f} ms ({stats['saved']} round trips saved)")
+    print(f"  flaky translator : {flaky_stats['calls']:6d} calls ({flaky_stats['fallbacks']} batches retried per segment)")
+
+
+def bench_cache():
+    """
+    Translation cache: hits and misses, TTL expiry, LRU eviction and reuse by a new
+    instance (a restart). Lookups must not write to the database between two flushes.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'cache.db')
+        texts = [' '.join(sample_tokens(8)) + f' {pos}' for pos in range(100)]
+        cache = translation_cache.TranslationCache(path, max_entries=len(texts))
+        with quiet():
+            put = timeit(lambda: [cache.put(text, text.upper()) for text in texts], repeat=1)
+            assert all(cache.get(text) == text.upper() for text in texts)
+            assert cache.get('never translated') is None
+            changes = cache.connect().total_changes
+            hit = timeit(lambda: [cache.get(text) for text in texts], repeat=3)
+            # At most one flush of the two counters during the burst
+            assert cache.connect().total_changes - changes <= 2
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (400, 1, 100), stats
+        assert (stats['total_hits'], stats['total_misses']) == (400, 1), stats
+
+        # LRU: touch the first ten entries, then ten new ones evict the next ten
+        saved, translation_cache.TOUCH_SECONDS = translation_cache.TOUCH_SECONDS, 0.0
+        try:
+            for text in texts[:10]:
+                cache.get(text)
+        finally:
+            translation_cache.TOUCH_SECONDS = saved
+        for pos in range(10):
+            cache.put(f'new {pos}', f'NEW {pos}')
+        assert all(cache.get(text) == text.upper() for text in texts[:10])
+        assert all(cache.get(text) is None for text in texts[10:20])
+        assert all(cache.get(text) == text.upper() for text in texts[20:])
+        assert cache.stats()['entries'] == len(texts)
+        assert cache.connect().execute("SELECT COUNT(*) FROM translations").fetchone()[0] == len(texts)
+
+        # A restart: a new instance on the same file serves the entries and keeps the totals
+        restarted = translation_cache.TranslationCache(path, max_entries=len(texts))
+        assert restarted.get(texts[50]) == texts[50].upper() and restarted.get('new 3') == 'NEW 3'
+        stats = restarted.stats()
+        assert (stats['hits'], stats['entries']) == (2, len(texts)), stats
+        assert stats['total_hits'] == 400 + 10 + 10 + 80 + 2, stats
+
+        # TTL: expired entries are misses at once and swept by a later put
+        expiring = translation_cache.TranslationCache(os.path.join(folder, 'ttl.db'), ttl=0.2)
+        expiring.put('old', 'OLD')
+        assert expiring.get('old') == 'OLD'
+        time.sleep(0.3)
+        assert expiring.get('old') is None
+        expiring.next_expiry = 0.0
+        expiring.put('fresh', 'FRESH')
+        assert expiring.stats()['entries'] == 1 and expiring.get('fresh') == 'FRESH'
+    print(f"cache: {len(texts)} entries")
+    print(f"  put              : {put / len(texts) * 1e6:10.1f} us")
+    print(f"  hit              : {hit / len(texts) * 1e6:10.1f} us (no write between flushes)")
+
+
+class LatencyHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Stand-in translation server: upper-cases the POSTed text after an injected delay
+    (texts starting with "slow" take `slow_latency` seconds to simulate a hanging provider)
+    """
+    latency = 0.05
+    slow_latency = 5.0
+
+    def do_POST(self):
+        text = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        time.sleep(self.slow_latency if text.startswith('slow') else self.latency)
+        reply = text.upper().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def stand_in_server():
+    """
+    Run LatencyHandler on a free local port and yield a translate(text) function calling it
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), LatencyHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/translate"
+
+    def translate(text):
+        with urllib.request.urlopen(urllib.request.Request(url, data=text.encode('utf-8')), timeout=30) as reply:
+            return reply.read().decode('utf-8')
+
+    try:
+        yield translate
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def bench_async():
+    """
+    Load test: sequential translator calls vs the async pipeline, against a latency-injecting local server
+    """
+    rng = random.Random(3)
+    documents = ['\n'.join(' '.join(sample_tokens(rng.randint(5, 20))) for _ in range(4)) for _ in range(25)]
+
+    with stand_in_server() as translate:
+        def sequential():
+            # Two translator round trips per document, one after the other, like conversion_fun
+            return [translate(translate(document)) for document in documents]
+
+        concurrent = async_pipeline.AsyncPipeline(translate, str, translate, concurrency=16, timeout=1.0)
+
+        def run_async():
+            async def convert_all():
+                return await asyncio.gather(*(concurrent.convert(document) for document in documents))
+            return asyncio.run(convert_all())
+
+        with quiet():
+            results = run_async()
+            assert [result.upper() for result in results] == results
+            # A hanging call is abandoned after the timeout and its paragraph left untranslated
+            started = time.perf_counter()
+            hung = asyncio.run(concurrent.convert('slow paragraph\nfast paragraph'))
+            hung_elapsed = time.perf_counter() - started
+
+            # Once max_abandoned hung calls hold their threads, new calls are refused at once
+            # instead of queueing behind them (each asyncio.run is a new loop with its own semaphore)
+            limited = async_pipeline.AsyncPipeline(translate, str, translate, concurrency=2, timeout=0.2,
+                                                   max_abandoned=2)
+            asyncio.run(limited.convert('slow one\nslow two'))
+            started = time.perf_counter()
+            refused = asyncio.run(limited.convert('fast paragraph'))
+            refused_elapsed = time.perf_counter() - started
+        assert hung.split('\n')[0] == 'slow paragraph' and hung_elapsed < LatencyHandler.slow_latency
+        assert limited.abandoned >= limited.max_abandoned, limited.abandoned
+        assert refused == 'fast paragraph' and refused_elapsed < limited.timeout, refused_elapsed
+
+        before = timeit(sequential, repeat=1)
+        after = timeit(run_async, repeat=1)
+    paragraphs = sum(len(document.split('\n')) for document in documents)
+    print(f"async: {len(documents)} documents of 4 paragraphs, {LatencyHandler.latency * 1e3:.0f} ms injected latency")
+    print(f"  sequential       : {before * 1e3:10.1f} ms ({2 * len(documents)} calls, one per document and pass)")
+    print(f"  async (16 slots) : {after * 1e3:10.1f} ms ({2 * paragraphs} calls, one per paragraph and pass)")
+    print(f"  hanging provider : {hung_elapsed * 1e3:10.1f} ms (2 calls abandoned after {concurrent.timeout * 1e3:.0f} ms each)")
+    print(f"  refused          : {refused_elapsed * 1e3:10.1f} ms (while {limited.abandoned} abandoned calls run)")
+
+
+CONCURRENT_REQUESTS = 200
+
+
+def bench_concurrency():
+    """
+    Send CONCURRENT_REQUESTS distinct conversions to /api/convert (and the landing page)
+    through the Flask app from parallel threads, with the translators stubbed with random
+    latency, and check that no request receives another request's output
+    """
+    import app
+    import resources
+
+    rng = random.Random(4)
+    texts = [f"request{i} " + ' '.join(sample_tokens(rng.randint(5, 40))) for i in range(CONCURRENT_REQUESTS)]
+
+    class Translation():
+        def __init__(self, text):
+            self.text = text
+
+    class SlowTranslator():
+        def translate(self, text, dest='en'):
+            time.sleep(random.random() * 0.01)
+            return Translation(text.upper())
+
+    def slow_upper(text, *args):
+        time.sleep(random.random() * 0.01)
+        return text.upper()
+
+    # The HTML templates are not part of every checkout; without them only the API is exercised
+    landing = os.path.exists(os.path.join(app.app.root_path, app.app.template_folder, 'index.html'))
+
+    def convert(client, text):
+        response = client.post('/api/convert', json={'texts': [text], 'sentiment': True})
+        page = client.get('/').status_code if landing else 200
+        return response.status_code, response.get_json(), page
+
+    saved = resources.translator, idiomcorpus.translate, app.translations
+    resources.translator, idiomcorpus.translate = SlowTranslator, slow_upper
+    try:
+        with quiet(), tempfile.TemporaryDirectory() as tmp:
+            # Each phase starts from an empty translation cache, so every request calls the translator
+            app.translations = translation_cache.TranslationCache(os.path.join(tmp, 'serial.db'))
+            client = app.app.test_client()
+            expected = [convert(client, text) for text in texts]
+
+            app.translations = translation_cache.TranslationCache(os.path.join(tmp, 'parallel.db'))
+            barrier = threading.Barrier(CONCURRENT_REQUESTS)
+            results = [None] * CONCURRENT_REQUESTS
+
+            def request(i):
+                client = app.app.test_client()
+                barrier.wait()
+                results[i] = convert(client, texts[i])
+
+            threads = [threading.Thread(target=request, args=(i,)) for i in range(CONCURRENT_REQUESTS)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+    finally:
+        resources.translator, idiomcorpus.translate, app.translations = saved
+
+    failed = [i for i in range(CONCURRENT_REQUESTS) if results[i] is None or results[i][0] != 200 or results[i][2] != 200]
+    partial = [i for i in range(CONCURRENT_REQUESTS) if results[i] and results[i][1]['results'][0].get('partial')]
+    mixed = [i for i in range(CONCURRENT_REQUESTS) if i not in failed and i not in partial and results[i] != expected[i]]
+    print(f"concurrency: {CONCURRENT_REQUESTS} parallel requests to /api/convert{' and /' if landing else ''} "
+          f"in {elapsed * 1e3:.1f} ms")
+    print(f"  failed requests  : {len(failed):10d}")
+    print(f"  partial results  : {len(partial):10d}")
+    print(f"  mixed-up outputs : {len(mixed):10d}")
+    if failed:
+        raise SystemExit(f"concurrency: requests {failed[:10]} failed")
+    if mixed:
+        raise SystemExit(f"concurrency: requests {mixed[:10]} received another request's output")
+
+
+DEADLINE_BUDGET = 0.5
+DEADLINE_SLACK = 0.25
+
+
+def bench_deadline():
+    """
+    Conversions against hanging translators: each request returns partial results within
+    its deadline. Calls cut short by the deadline leave the circuit breakers closed; calls
+    that run out of TRANSLATE_TIMEOUT open them, after which requests no longer wait for
+    the translators.
+    """
+    import app
+    import resources
+
+    hang = threading.Event()
+
+    class HangingTranslator():
+        def translate(self, text, dest='en'):
+            hang.wait(5)
+            raise RuntimeError("translator hung")
+
+    def hanging_translate(text, lang):
+        hang.wait(5)
+        raise RuntimeError("translator hung")
+
+    # Each backend fails once per request until its circuit opens (google first, then
+    # mtranslate), after which a request makes no translator call at all
+    texts = [' '.join(sample_tokens(20 + i)) for i in range(2 * deadlines.BREAKER_FAILURES + 1)]
+    saved = (resources.translator, idiomcorpus.translate, dict(app.breakers), app.app.config['RETRANSLATE_MODE'],
+             app.app.config['TRANSLATE_TIMEOUT'])
+    resources.translator, idiomcorpus.translate = HangingTranslator, hanging_translate
+    # Both passes on every request, whatever the dictionary recognises
+    app.app.config['RETRANSLATE_MODE'] = 'full'
+    def reset_breakers():
+        # Fresh breakers and call pools: no abandoned calls left from an earlier phase
+        for backend in app.breakers:
+            app.breakers[backend] = deadlines.CircuitBreaker(backend, failures=deadlines.BREAKER_FAILURES, reset=60)
+
+    def convert_all(texts):
+        timings = []
+        with quiet():
+            for text in texts:
+                pipeline = app.ConversionPipeline(text, deadline=deadlines.Deadline(DEADLINE_BUDGET))
+                started = time.perf_counter()
+                output = pipeline.convert()
+                timings.append(time.perf_counter() - started)
+                assert output and pipeline.partial, (output, pipeline.deadline.skipped)
+        return timings
+
+    try:
+        # TRANSLATE_TIMEOUT beyond the budget: every call is cut short by the deadline
+        reset_breakers()
+        app.app.config['TRANSLATE_TIMEOUT'] = 10 * DEADLINE_BUDGET
+        short = convert_all(texts[:deadlines.BREAKER_FAILURES + 1])
+        short_states = {backend: breaker.state for backend, breaker in app.breakers.items()}
+        # The shipped configuration, scaled down to the budget (TRANSLATE_TIMEOUT as long as the
+        # deadline): calls run out of the backend's own timeout and count as failures
+        app.app.config['TRANSLATE_TIMEOUT'] = DEADLINE_BUDGET * saved[4] / app.app.config['REQUEST_DEADLINE']
+        reset_breakers()
+        timings = convert_all(texts)
+        states = {backend: breaker.state for backend, breaker in app.breakers.items()}
+
+        # Hung calls to one backend only hold that backend's threads; past its cap of
+        # abandoned calls it is refused at once, and the refusals are not counted
+        hung = deadlines.CircuitBreaker('hung', pool=deadlines.CallPool('hung', workers=2, max_abandoned=2))
+        healthy = deadlines.CircuitBreaker('healthy', pool=deadlines.CallPool('healthy', workers=2, max_abandoned=2))
+        refused = 0
+        for _ in range(4):
+            try:
+                hung.call(lambda: hang.wait(5), 0.05)
+            except deadlines.CallRefused:
+                refused += 1
+            except deadlines.DeadlineExceeded:
+                pass
+        assert (refused, hung.failures, hung.pool.abandoned) == (2, 2, 2), (refused, hung.failures)
+        assert healthy.call(lambda: 'ok', 0.2) == 'ok' and healthy.failures == 0
+    finally:
+        hang.set()
+        resources.translator, idiomcorpus.translate = saved[:2]
+        app.breakers.update(saved[2])
+        app.app.config['RETRANSLATE_MODE'], app.app.config['TRANSLATE_TIMEOUT'] = saved[3:]
+
+    print(f"deadline: {len(texts)} requests, {DEADLINE_BUDGET * 1e3:.0f} ms budget, translators hanging")
+    print(f"  cut by deadline  : {max(short) * 1e3:10.1f} ms slowest of {len(short)} (circuits "
+          f"{', '.join(sorted(set(short_states.values())))})")
+    print(f"  slowest request  : {max(timings) * 1e3:10.1f} ms")
+    print(f"  hung backend     : {refused} calls refused after {hung.pool.max_abandoned} abandoned, "
+          f"other backend unaffected")
+    print(f"  last request     : {timings[-1] * 1e3:10.1f} ms (circuits {', '.join(sorted(set(states.values())))})")
+    if set(short_states.values()) != {'closed'}:
+        raise SystemExit(f"deadline: calls cut short by the deadline opened a circuit: {short_states}")
+    if max(timings + short) > DEADLINE_BUDGET + DEADLINE_SLACK:
+        raise SystemExit(f"deadline: a request took {max(timings + short) * 1e3:.0f} ms "
+                         f"(budget {DEADLINE_BUDGET * 1e3:.0f} ms)")
+    if set(states.values()) != {'open'}:
+        raise SystemExit(f"deadline: circuits not open after {len(texts)} failing requests: {states}")
+    if timings[-1] > DEADLINE_SLACK:
+        raise SystemExit(f"deadline: request with open circuits took {timings[-1] * 1e3:.0f} ms")
+
+
+class GeneratedUpload():
+    """
+    Binary stream of `size` bytes of Hinglish paragraphs, produced on the fly (nothing is held in memory)
+    """
+
+    def __init__(self, size):
+        self.remaining = size
+        self.paragraph = (' '.join(sample_tokens(80)) + '\n\n').encode('utf-8')
+
+    def read(self, size):
+        size = min(size, self.remaining)
+        self.remaining -= size
+        repeated = self.paragraph * (size // len(self.paragraph) + 1)
+        return repeated[:size]
+
+
+def bench_stream():
+    """
+    Peak memory of streaming file conversion for growing upload sizes (conversion stubbed out)
+    """
+    print("stream: paragraph-by-paragraph conversion of generated uploads")
+    for size in (1, 4, 16):
+        upload = GeneratedUpload(size * 2 ** 20)
+        tracemalloc.start()
+        started = time.perf_counter()
+        sent = 0
+        for part in streaming.convert_paragraphs(streaming.read_paragraphs(upload), str.upper):
+            sent += len(part)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {size:3d} MB upload    : peak {peak / 2 ** 10:8.1f} KB, {sent / 2 ** 20:6.1f} MB sent in {elapsed * 1e3:.0f} ms")
+
+
+def slow_upper(text):
+    """
+    Job conversion stand-in: slow enough to kill a job between its paragraphs
+    """
+    time.sleep(0.2)
+    return text.upper()
+
+
+JOB_CHILD = """
+import io, sys, time
+import benchmark, jobs
+queue = jobs.JobQueue(sys.argv[1], sys.argv[2], benchmark.slow_upper, workers=1)
+print(queue.submit(io.BytesIO(sys.argv[3].encode('utf-8'))), flush=True)
+time.sleep(600)
+"""
+
+
+def bench_jobs():
+    """
+    Kill a process running a job (and its pool worker) mid-job, restart the queue in this
+    process and check the job resumes from its saved progress long before STALE_SECONDS,
+    with every paragraph in the result exactly once.
+    """
+    paragraphs = [f"paragraph {pos} " + ' '.join(sample_tokens(5)) for pos in range(20)]
+    text = '\n\n'.join(paragraphs)
+    with tempfile.TemporaryDirectory() as folder:
+        db_file = os.path.join(folder, 'jobs.db')
+        child = subprocess.Popen([sys.executable, "-c", JOB_CHILD, db_file, folder, text], stdout=subprocess.PIPE,
+                                 text=True, cwd=os.path.dirname(os.path.abspath(__file__)), start_new_session=True)
+        job_id = child.stdout.readline().strip()
+        conn = jobs.connect(db_file)
+        try:
+            done = 0
+            deadline = time.monotonic() + 30
+            while done < 5 and time.monotonic() < deadline:
+                time.sleep(0.05)
+                done = conn.execute("SELECT done FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            os.killpg(child.pid, signal.SIGKILL)
+            child.wait()
+            killed = conn.execute("SELECT status, done FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        assert killed[0] == 'running' and 0 < killed[1] < len(paragraphs), killed
+
+        started = time.monotonic()
+        queue = jobs.JobQueue(db_file, folder, slow_upper, workers=1)
+        with quiet():
+            queue.start()
+            status = queue.status(job_id)
+            while status['status'] not in ('done', 'failed') and time.monotonic() - started < jobs.STALE_SECONDS:
+                time.sleep(0.05)
+                status = queue.status(job_id)
+        elapsed = time.monotonic() - started
+        queue.executor.shutdown()
+        with open(queue.result_path(job_id), encoding='utf-8') as f:
+            result = f.read()
+    print(f"jobs: killed after {killed[1]}/{len(paragraphs)} paragraphs, resumed and {status['status']} "
+          f"in {elapsed:.1f} s (stale after {jobs.STALE_SECONDS} s)")
+    assert status['status'] == 'done' and elapsed < jobs.STALE_SECONDS / 2, status
+    assert result.split('\n\n')[:-1] == [paragraph.upper() for paragraph in paragraphs]
+
+    # Only the pool worker dies: the broken pool is replaced and the job resumes
+    with tempfile.TemporaryDirectory() as folder:
+        queue = jobs.JobQueue(os.path.join(folder, 'jobs.db'), folder, slow_upper, workers=1)
+        with quiet():
+            job_id = queue.submit(io.BytesIO(text.encode('utf-8')))
+            conn = jobs.connect(queue.db_file)
+            try:
+                done, owner = 0, None
+                deadline = time.monotonic() + 30
+                while done < 5 and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    done, owner = conn.execute("SELECT done, owner FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            finally:
+                conn.close()
+            os.kill(int(owner.rpartition(':')[2]), signal.SIGKILL)
+            started = time.monotonic()
+            status = queue.status(job_id)
+            while status['status'] not in ('done', 'failed') and time.monotonic() - started < jobs.STALE_SECONDS:
+                time.sleep(0.05)
+                status = queue.status(job_id)
+            elapsed = time.monotonic() - started
+            second = queue.submit(io.BytesIO(b'after the restart'))
+            while queue.status(second)['status'] != 'done' and time.monotonic() - started < jobs.STALE_SECONDS:
+                time.sleep(0.05)
+            second = queue.status(second)
+        queue.executor.shutdown()
+        with open(queue.result_path(job_id), encoding='utf-8') as f:
+            result = f.read()
+    print(f"  worker killed    : after {done}/{len(paragraphs)} paragraphs, pool restarted and job {status['status']} "
+          f"in {elapsed:.1f} s")
+    assert status['status'] == 'done' and elapsed < jobs.STALE_SECONDS / 2, status
+    assert result.split('\n\n')[:-1] == [paragraph.upper() for paragraph in paragraphs]
+    assert second['status'] == 'done', second
+
+
+ENGLISH_SAMPLE = ("Sometimes life feels like everything is going wrong, and no matter how hard you work "
+                  "the result is disappointing. People do not value your efforts, their negativity breaks "
+                  "your dreams, but a good friend and a happy moment can make a wonderful day great again!")
+
+
+def textblob_buckets(text):
+    """
+    Word bucketing as generate_sentiment_chart did it before the lexicon: one TextBlob per word, three passes
+    """
+    from textblob import TextBlob
+
+    words = text.split()
+    word_sentiments = [TextBlob(word).sentiment.polarity for word in words]
+    negative = [word for word, sent in zip(words, word_sentiments) if sent < -0.05]
+    neutral = [word for word, sent in zip(words, word_sentiments) if -0.05 <= sent <= 0.05]
+    positive = [word for word, sent in zip(words, word_sentiments) if sent > 0.05]
+    return negative, neutral, positive
+
+
+def bench_sentiment():
+    """
+    Per-word sentiment bucketing: TextBlob per word vs the precomputed polarity lexicon
+    """
+    rng = random.Random(5)
+    english = ENGLISH_SAMPLE.split()
+    documents = [' '.join(rng.choice(english) for _ in range(rng.randint(50, 500))) + ' ' +
+                 ' '.join(sample_tokens(50)) for _ in range(20)]
+    words = sum(len(document.split()) for document in documents)
+
+    build = timeit(lambda: sentiment.load_lexicon(), repeat=1)
+    assert [textblob_buckets(document) for document in documents] == sentiment.bucket_batch(documents)
+
+    before = timeit(lambda: [textblob_buckets(document) for document in documents], repeat=1)
+    after = timeit(lambda: sentiment.bucket_batch(documents))
+    print(f"sentiment: {len(documents)} documents, {words} words "
+          f"(lexicon of {len(sentiment.load_lexicon())} words built in {build * 1e3:.1f} ms)")
+    print(f"  TextBlob per word: {before / words * 1e6:10.2f} us/word")
+    print(f"  lexicon, 1 pass  : {after / words * 1e6:10.2f} us/word")
+    print(f"  speedup          : {before / after:10.1f}x")
+
+    # Whole request: overall TextBlob score plus per-word buckets vs one sentiment engine pass
+    from textblob import TextBlob
+
+    def textblob_request(document):
+        return TextBlob(document).sentiment.polarity, textblob_buckets(document)
+
+    def engine_cold():
+        sentiment.memo_analysis.cache_clear()
+        return [sentiment.analyze(document) for document in documents]
+
+    for document, analysis in zip(documents, engine_cold()):
+        buckets = (list(analysis.negative), list(analysis.neutral), list(analysis.positive))
+        assert textblob_request(document) == (analysis.polarity, buckets)
+    before = timeit(lambda: [textblob_request(document) for document in documents], repeat=1)
+    cold = timeit(engine_cold)
+    warm = timeit(lambda: [sentiment.analyze(document) for document in documents])
+    print(f"  request, TextBlob: {before / len(documents) * 1e3:10.3f} ms/document")
+    print(f"  request, engine  : {cold / len(documents) * 1e3:10.3f} ms/document (repeated text: "
+          f"{warm / len(documents) * 1e6:.2f} us)")
+
+    # Only short texts are memoized whole, so the memo cannot pin large documents
+    sentiment.memo_analysis.cache_clear()
+    large = ' '.join(ENGLISH_SAMPLE.split() * 2000)
+    assert sentiment.analyze(large) == sentiment.analyze(large)
+    assert sentiment.memo_analysis.cache_info().currsize == 0
+    short = [document for document in documents if len(document) <= sentiment.MEMO_MAX_CHARS]
+    cold = timeit(lambda: [sentiment.memo_analysis.cache_clear()] + [sentiment.analyze(text) for text in short])
+    warm = timeit(lambda: [sentiment.analyze(text) for text in short])
+    print(f"  memo             : {len(short)} short documents {cold / len(short) * 1e6:.1f} us cold, "
+          f"{warm / len(short) * 1e6:.2f} us repeated; {len(large) / 2 ** 10:.0f} KB document not memoized")
+
+
+def plotly_chart_json(bar_values, hover_text):
+    """
+    Chart JSON as generate_sentiment_chart built it before the cached template: a full figure per request
+    """
+    import json
+    import plotly
+    import plotly.graph_objs as go
+
+    fig = go.Figure(data=[go.Bar(x=chart.CATEGORIES, y=bar_values, marker_color=chart.COLORS,
+                                 text=[f'{val:.2f}%' for val in bar_values], textposition='auto',
+                                 hovertext=hover_text, hoverinfo='text')])
+    fig.update_layout(title='Sentiment Analysis Breakdown', xaxis_title='Sentiment Categories',
+                      yaxis_title='Percentage of Words', height=500, width=500, template='plotly_white')
+    return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def bench_chart():
+    """
+    Sentiment chart: full Plotly figure per request vs the cached figure template
+    """
+    import json
+
+    rng = random.Random(6)
+    requests = []
+    for _ in range(50):
+        counts = [rng.randint(0, 100) for _ in range(3)]
+        total = sum(counts) or 1
+        values = [count / total * 100 for count in counts]
+        hover = [f'{name} Words: {count}<br>Percentage: {value:.2f}%<br>Words: {", ".join(sample_tokens(5))}...'
+                 for name, count, value in zip(chart.CATEGORIES, counts, values)]
+        requests.append((values, hover))
+
+    build = timeit(chart.figure_template, repeat=1)
+    for values, hover in requests:
+        assert json.loads(plotly_chart_json(values, hover)) == json.loads(chart.sentiment_chart_json(values, hover))
+
+    before = timeit(lambda: [plotly_chart_json(values, hover) for values, hover in requests], repeat=3)
+    after = timeit(lambda: [chart.sentiment_chart_json(values, hover) for values, hover in requests])
+    old_bytes = len(plotly_chart_json(*requests[0]).encode('utf-8'))
+    new_bytes = len(chart.sentiment_chart_json(*requests[0]).encode('utf-8'))
+    encoder = 'orjson' if chart.orjson is not None else 'json'
+    print(f"chart: {len(requests)} requests (template built in {build * 1e3:.1f} ms, {encoder} encoder)")
+    print(f"  plotly figure    : {before / len(requests) * 1e3:10.3f} ms/request {old_bytes:8d} bytes")
+    print(f"  cached template  : {after / len(requests) * 1e3:10.3f} ms/request {new_bytes:8d} bytes")
+    print(f"  speedup          : {before / after:10.1f}x")
+
+    import app
+    # Text without words gets a chart with empty bars
+    for text in ('', ' \n\t '):
+        assert json.loads(app.generate_sentiment_chart(text, 0))['data'][0]['y'] == [0, 0, 0], repr(text)
+
+
+SOAK_REQUESTS = 100000
+SOAK_MAX_GROWTH = 5 * 1024 * 1024
+
+
+def rss():
+    """
+    Resident set size of this process in bytes (Linux)
+    """
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def bench_soak():
+    """
+    Run the idiom stage SOAK_REQUESTS times (translation stubbed out) and check RSS stays flat
+    """
+    sentences = [' '.join(sample_tokens(n)) for n in range(5, 50)]
+    sentences += synthetic_idioms(100)
+    translate, idiomcorpus.translate = idiomcorpus.translate, lambda text, lang: text
+    samples = []
+    try:
+        with quiet():
+            for request in range(SOAK_REQUESTS):
+                # Same steps and error handling as app.perform_operation
+                corpus = idiomcorpus.Idiomcorpus()
+                corpus.idiom_init(sentences[request % len(sentences)])
+                try:
+                    corpus.check_idiom()
+                    corpus.idiom_convert()
+                    corpus.idiom_display()
+                except Exception:
+                    pass
+                if request % (SOAK_REQUESTS // 10) == 0:
+                    samples.append(rss())
+    finally:
+        idiomcorpus.translate = translate
+    samples.append(rss())
+    # The first sample includes loading the corpus, so growth is measured after it
+    growth = max(samples[1:]) - samples[1]
+    print(f"soak: {SOAK_REQUESTS} requests, {len(idiomcorpus.load_idioms().hindi)} idioms loaded")
+    print(f"  rss samples (MB) : {' '.join(f'{sample / 2 ** 20:.1f}' for sample in samples)}")
+    print(f"  growth           : {growth / 2 ** 20:10.2f} MB")
+    if growth > SOAK_MAX_GROWTH:
+        raise SystemExit(f"soak: RSS grew by {growth / 2 ** 20:.2f} MB over {SOAK_REQUESTS} requests")
+
+
+STARTUP_TARGET = 1.0
+HEAVY_MODULES = ["enchant", "googletrans", "nltk", "plotly.graph_objs", "textblob"]
+
+# Run in a fresh interpreter: import the app, then serve a first /api/convert request
+# with the translators stubbed out and a throw-away translation cache. With "lazy" the
+# background preload is switched off (HINGLISH_PRELOAD=0), so the first request loads everything itself;
+# with "preload" the request is sent once the preload has finished.
+STARTUP_SCRIPT = """
+import json, os, sys, tempfile, time
+sys.stdout = sys.stderr  # Only the result goes to stdout
+start = time.perf_counter()
+import resources
+threads = []
+if sys.argv[1] == 'lazy':
+    os.environ['HINGLISH_PRELOAD'] = '0'
+    resources.preload_in_background = lambda steps: sys.exit('preload started with HINGLISH_PRELOAD=0')
+else:
+    preload = resources.preload_in_background
+    resources.preload_in_background = lambda steps: threads.append(preload(steps))
+import app
+imported = time.perf_counter()
+for thread in threads:
+    thread.join()
+ready = time.perf_counter()
+loaded = [name for name in sys.argv[2:] if name in sys.modules]
+
+import idiomcorpus, translation_cache
+
+class Translation():
+    def __init__(self, text):
+        self.text = text
+
+class Translator():
+    def translate(self, text, dest='en'):
+        return Translation(text)
+
+resources.translator = lambda: Translator()
+idiomcorpus.translate = lambda text, lang: text
+app.translations = translation_cache.TranslationCache(os.path.join(tempfile.mkdtemp(), 'cache.db'))
+client = app.app.test_client()
+response = client.post('/api/convert', json={'texts': ['mai ghar ja rha hu'], 'sentiment': True, 'chart': True})
+first = time.perf_counter()
+print(json.dumps({'import': imported - start, 'ready': ready - start, 'first': first - start,
+                  'request': first - ready, 'status': response.status_code,
+                  'loaded': loaded, 'error': 'error' in response.get_json()['results'][0]}), file=sys.__stdout__)
+"""
+
+
+def run_python(code, *args):
+    """
+    Run code in a fresh interpreter from this directory and return the last line it prints
+    """
+    result = subprocess.run([sys.executable, "-c", code, *args], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise SystemExit(f"startup: subprocess failed:\n{result.stderr}")
+    return result.stdout.strip().splitlines()[-1]
+
+
+def bench_startup():
+    """
+    Cold start: import cost of the heavy dependencies, then the time to import the app and
+    to answer the first request, with and without the background preload. Importing the
+    app must not load any heavy dependency and, even without the preload, the first
+    response must come within STARTUP_TARGET seconds of the interpreter starting.
+    """
+    print("startup: fresh interpreter per measurement")
+    for name in HEAVY_MODULES:
+        try:
+            elapsed = float(run_python("import importlib, sys, time\n"
+                                       "start = time.perf_counter()\n"
+                                       "importlib.import_module(sys.argv[1])\n"
+                                       "print(time.perf_counter() - start)", name))
+            print(f"  {'import ' + name:24s}: {elapsed * 1e3:10.1f} ms")
+        except SystemExit:
+            print(f"  {'import ' + name:24s}: not installed")
+    for mode in ("lazy", "preload"):
+        result = json.loads(run_python(STARTUP_SCRIPT, mode, *HEAVY_MODULES))
+        print(f"  {mode + ': import app':24s}: {result['import'] * 1e3:10.1f} ms")
+        if mode == "preload":
+            print(f"  {mode + ': preload done':24s}: {result['ready'] * 1e3:10.1f} ms")
+        print(f"  {mode + ': first response':24s}: {result['first'] * 1e3:10.1f} ms "
+              f"(request took {result['request'] * 1e3:.1f} ms, status {result['status']})")
+        if mode == "lazy" and result['loaded']:
+            raise SystemExit(f"startup: importing the app loaded {', '.join(result['loaded'])}")
+        if result['status'] != 200 or result['error']:
+            raise SystemExit(f"startup: the first request failed ({mode})")
+        if mode == "lazy" and result['first'] > STARTUP_TARGET:
+            raise SystemExit(f"startup: first request answered after {result['first']:.2f} s "
+                             f"(target {STARTUP_TARGET:.2f} s)")
+
+
+def char_tokenize(sentence):
+    """
+    Idiomcorpus.idiom_tokenize as it was before the token stream: split on spaces character by character
+    """
+    tokens, word = [], []
+    for char in sentence:
+        if char == ' ':
+            tokens.append(''.join(word))
+            word = []
+        else:
+            word.append(char)
+    tokens.append(''.join(word))
+    return tokens
+
+
+def string_convert(app, translated_text):
+    """
+    Notation expansion, spell check, idiom matching (exact, variant and fuzzy), the
+    second translation of the spans that need it, and sentiment as they were done before
+    the token stream: every stage turns strings into token lists and back
+    """
+    import resources
+
+    token = resources.word_tokenize(translated_text)
+    # Short forms of several tokens are expanded as a whole, as the token stream does
+    matches = {first: (last, long) for first, last, long in app.notation_index.matches(token)}
+    ft, pos = [], 0
+    while pos < len(token):
+        last, long = matches.get(pos, (pos + 1, token[pos]))
+        ft.append(long)
+        pos = last
+    ft = " ".join(ft)
+    token = resources.word_tokenize(ft)
+    d = resources.dictionary()
+    known = [d.check(i) for i in token]
+    expanded = " ".join(token)
+
+    corpus = idiomcorpus.Idiomcorpus()
+    corpus.idiom_init(expanded)
+    inputsplit = char_tokenize(corpus.input)
+    inputtoken = list(set(inputsplit))
+    inputset = set(inputtoken)
+    index = corpus.idiom_index()
+    overlap = index.overlap(token for token in inputset if idiom_index.is_devanagari(token))
+    unicount, uniidiom = 0, ''
+    for pos in sorted(overlap):
+        idiomtoken = index.tokens[pos]
+        counter = overlap[pos] if idiomtoken[0] in inputset else 0
+        if counter > unicount and len(idiomtoken) <= len(inputtoken):
+            unicount, uniidiom = counter, index.idioms[pos]
+    match = None
+    if not uniidiom and corpus.store.variants is not None:
+        match = corpus.store.variants.match(inputsplit)
+        if match is None and corpus.store.fuzzy is not None and len(inputsplit) <= fuzzy_idioms.MAX_INPUT_WORDS:
+            match = corpus.store.fuzzy.match(inputsplit)
+    try:
+        outputsplit = inputsplit
+        if match is not None:
+            eidiom = corpus.english[match.idiom].split(' ')
+            outputsplit = inputsplit[:match.first] + eidiom + inputsplit[match.last:]
+            known = known[:match.first] + [None] * len(eidiom) + known[match.last:]
+        elif uniidiom:
+            corpus.hidiom = uniidiom
+            eidiom = corpus.idiom_convert()
+            hidiomsplit = char_tokenize(uniidiom)
+            if hidiomsplit[0] in inputsplit:
+                temp = inputsplit.index(hidiomsplit[0])
+                for word in eidiom:
+                    outputsplit[temp] = word
+                    known[temp] = None
+                    temp += 1
+                for word in hidiomsplit:
+                    if word in outputsplit:
+                        pos = outputsplit.index(word)
+                        del outputsplit[pos], known[pos]
+        # Second translation of the runs of words the spell check did not know
+        runs, first = [], None
+        for pos, word in enumerate(outputsplit + ['']):
+            if pos < len(outputsplit) and known[pos] is not True and any(char.isalpha() for char in word):
+                first = pos if first is None else first
+            elif first is not None:
+                runs.append((first, pos))
+                first = None
+        if runs:
+            segments = [' '.join(outputsplit[first:last]) for first, last in runs]
+            translated, _ = batch_translation.translate_batch(segments, app.mtranslate_call)
+            for (first, last), text in reversed(list(zip(runs, translated))):
+                outputsplit[first:last] = text.split()
+        output = ' '.join(outputsplit)
+    except Exception:
+        output = expanded
+    analysis = app.analyze_sentiment(output)
+    return output, analysis, app.generate_sentiment_chart(output, analysis['polarity'])
+
+
+def stream_convert(app, translated_text):
+    pipeline = app.ConversionPipeline(translated_text=translated_text)
+    return pipeline.convert(), pipeline.analyze(), pipeline.sentiment_chart
+
+
+# Per request, the token stream must allocate TOKENS_ALLOCATION times less and run
+# TOKENS_SPEEDUP times faster than the string round trips (measured 1.7x and 1.2-1.7x)
+TOKENS_ALLOCATION = 1.5
+TOKENS_SPEEDUP = 1.1
+
+
+def bench_tokens():
+    """
+    Conversion after translation (notations, spell check, idioms, second translation,
+    sentiment) with strings re-tokenized at every stage vs one token stream edited in
+    place: same stages and output, smaller allocations per request (measured with tracemalloc)
+    """
+    import app
+
+    rng = random.Random(6)
+    english = ENGLISH_SAMPLE.split()
+    # No double quotes: the second word_tokenize pass turned closing quotes into opening ones
+    shorts = ['FB', 'IDK', 'TL;DR', 'btw', 'Mr.', 'w/o', 'IG', 'asap', "(aside)", "don't", 'end.']
+    idioms = synthetic_idioms(50, seed=6)
+    texts = []
+    for _ in range(200):
+        words = [rng.choice(english + shorts) for _ in range(rng.randint(5, 60))]
+        if rng.random() < 0.5:
+            words.insert(rng.randint(0, len(words)), rng.choice(idioms))
+        texts.append(' '.join(words))
+
+    translate, idiomcorpus.translate = idiomcorpus.translate, lambda text, lang: text
+    try:
+        with quiet():
+            sentiment.load_lexicon()
+            chart.figure_template()
+            for text in texts:
+                old = string_convert(app, text)
+                new = stream_convert(app, text)
+                assert old == new, f"different conversion of {text!r}"
+
+            converters = (("strings", string_convert), ("token stream", stream_convert))
+            # Timed in alternation, so that a slow spell of the machine hits both
+            times = {name: [] for name, _ in converters}
+            for _ in range(5):
+                for name, convert in converters:
+                    sentiment.memo_analysis.cache_clear()
+                    times[name].append(timeit(lambda: [convert(app, text) for text in texts], repeat=1))
+            results = {}
+            for name, convert in converters:
+                sentiment.memo_analysis.cache_clear()
+                tracemalloc.start()
+                peaks = []
+                for text in texts:
+                    tracemalloc.reset_peak()
+                    base = tracemalloc.get_traced_memory()[0]
+                    convert(app, text)
+                    peaks.append(tracemalloc.get_traced_memory()[1] - base)
+                tracemalloc.stop()
+                results[name] = (min(times[name]), sum(peaks) / len(peaks))
+    finally:
+        idiomcorpus.translate = translate
+
+    print(f"tokens: {len(texts)} requests (translators stubbed), same output, sentiment and chart")
+    for name, (elapsed, peak) in results.items():
+        print(f"  {name:17s}: {elapsed / len(texts) * 1e3:8.3f} ms/request, peak {peak / 2 ** 10:7.1f} KB allocated")
+    before, after = results["strings"], results["token stream"]
+    print(f"  speedup          : {before[0] / after[0]:10.1f}x, peak allocation {before[1] / after[1]:.1f}x smaller")
+    if before[1] / after[1] < TOKENS_ALLOCATION:
+        raise SystemExit(f"tokens: peak allocation only {before[1] / after[1]:.1f}x smaller "
+                         f"(target {TOKENS_ALLOCATION:.1f}x)")
+    if before[0] / after[0] < TOKENS_SPEEDUP:
+        raise SystemExit(f"tokens: speedup only {before[0] / after[0]:.2f}x (target {TOKENS_SPEEDUP:.1f}x)")
+
+
+class LexiconDictionary():
+    """
+    Stand-in spell checker knowing the English words of the offline lexicon, so that the
+    Hinglish words the lexicon leaves untranslated (and Hindi idioms) count as not English
+    """
+
+    def __init__(self):
+        with open(offline_translation.LEXICON_PATH, encoding="utf-8") as f:
+            lines = [line.rstrip('\n').split('\t') for line in f if '\t' in line and not line.startswith('#')]
+        self.words = {word.lower() for _, english in lines for word in english.split()}
+        self.words.update(word.lower() for word in ENGLISH_SAMPLE.split())
+
+    def check(self, word):
+        return word.lower() in self.words
+
+
+def bench_retranslate():
+    """
+    Characters and calls sent to the second translator per request with RETRANSLATE_MODE
+    full, spans and off; the input stands in for Google's output (the offline lexicon's
+    translation of Hinglish text with Hindi idioms), and full and spans must agree
+    """
+    import app
+    import resources
+
+    texts = [offline_translation.translate(text) for text in hinglish_corpus(30, 200, seed=7)]
+    sent = []
+
+    def counting_translate(text, lang):
+        sent.append(text)
+        return text
+
+    saved = idiomcorpus.translate, resources.dictionary, app.app.config['RETRANSLATE_MODE']
+    idiomcorpus.translate, resources.dictionary = counting_translate, LexiconDictionary
+    results = {}
+    try:
+        with quiet():
+            for mode in ("full", "spans", "off"):
+                app.app.config['RETRANSLATE_MODE'] = mode
+                del sent[:]
+                pipelines = [app.ConversionPipeline(translated_text=text) for text in texts]
+                outputs = [pipeline.convert() for pipeline in pipelines]
+                chars = sum(pipeline.translated_chars.get('mtranslate', 0) for pipeline in pipelines)
+                results[mode] = (outputs, chars, len(sent))
+    finally:
+        idiomcorpus.translate, resources.dictionary = saved[:2]
+        app.app.config['RETRANSLATE_MODE'] = saved[2]
+
+    if results["spans"][0] != results["full"][0]:
+        raise SystemExit("retranslate: spans mode changed the output of an identity translator")
+    full_chars = results["full"][1]
+    print(f"retranslate: {len(texts)} requests, second pass by mode")
+    for mode, (_, chars, calls) in results.items():
+        print(f"  {mode:17s}: {chars / len(texts):8.1f} chars/request ({chars / full_chars:6.1%}), "
+              f"{calls / len(texts):.2f} calls/request")
+
+
+BASELINE_PATH = "benchmark_baseline.json"
+# Allowed slowdown against the baseline; shared machines easily vary by 20-30% between runs
+REGRESSION_TOLERANCE = 0.5
+STAGE_SIZES = {"small": (10, 100), "medium": (100, 30), "large": (1000, 5)}
+
+
+def stable_time(func, min_time=0.05, repeat=7):
+    """
+    Best time of one func() call, each sample looping func long enough (min_time) to be measurable
+    """
+    loops = 1
+    while True:
+        elapsed = timeit(lambda: [func() for _ in range(loops)], repeat=1)
+        if elapsed >= min_time:
+            break
+        loops *= 2
+    return timeit(lambda: [func() for _ in range(loops)], repeat=repeat) / loops
+
+
+def hinglish_corpus(words, count, seed=0):
+    """
+    `count` Hinglish texts of `words` words drawn from the sample text, half of them with an idiom
+    """
+    with open(SAMPLE_PATH, encoding="utf-8") as f:
+        vocabulary = f.read().split()
+    idioms = synthetic_idioms(50, seed=seed)
+    rng = random.Random(seed)
+    texts = []
+    for i in range(count):
+        text = [rng.choice(vocabulary) for _ in range(words)]
+        if i % 2:
+            text[rng.randrange(words):] = [rng.choice(idioms)]
+        texts.append(' '.join(text))
+    return texts
+
+
+def calibrate():
+    """
+    Time of a fixed pure-Python workload; stage times are stored relative to it so that
+    a baseline recorded on one machine can be checked on another
+    """
+    def workload():
+        counts = {}
+        for i in range(200000):
+            key = str(i % 1000)
+            counts[key] = counts.get(key, 0) + 1
+        return sorted(counts.items())
+    return stable_time(workload)
+
+
+def idiom_stage(text):
+    # Same steps and error handling as app.perform_operation
+    corpus = idiomcorpus.Idiomcorpus()
+    corpus.idiom_init(text)
+    try:
+        corpus.check_idiom()
+        corpus.idiom_convert()
+        return corpus.idiom_display()
+    except Exception:
+        return text
+
+
+def analyze_cold(app, text):
+    sentiment.memo_analysis.cache_clear()
+    return app.analyze_sentiment(text)
+
+
+def bench_stages(baseline_path=BASELINE_PATH, save=False, tolerance=REGRESSION_TOLERANCE, require=False):
+    """
+    Per-stage timings on Hinglish corpora of several sizes, with both translators stubbed out
+    (identity), compared with the stored baseline: fails if a stage got slower than the
+    baseline by more than `tolerance`, or, with require=True, if there is no baseline to
+    compare with. With save=True the timings become the new baseline.
+    """
+    import app
+
+    saved = app.google_translate, idiomcorpus.translate
+    app.google_translate, idiomcorpus.translate = (lambda text, deadline=None, stats=None: text), (lambda text, lang: text)
+    timings = {}
+    unit = calibrate()
+    try:
+        with quiet():
+            sentiment.load_lexicon()
+            chart.figure_template()
+            for size, (words, count) in STAGE_SIZES.items():
+                texts = hinglish_corpus(words, count)
+                tokens = [token for text in texts for token in text.split()]
+                corpus = idiomcorpus.Idiomcorpus()
+
+                def check_idiom():
+                    for text in texts:
+                        corpus.idiom_init(text)
+                        corpus.check_idiom()
+
+                stages = {
+                    "fetch_notations": lambda: [app.fetch_notations(token) for token in tokens],
+                    "check_idiom": check_idiom,
+                    "idiom_display": lambda: [idiom_stage(text) for text in texts],
+                    "analyze_sentiment": lambda: [analyze_cold(app, text) for text in texts],
+                    # The word buckets come from the (warm) analysis memo; this is the chart's own cost
+                    "generate_sentiment_chart": lambda: [app.generate_sentiment_chart(text, 0) for text in texts],
+                    "conversion_fun": lambda: [app.conversion_fun(text) for text in texts],
+                }
+                for stage, func in stages.items():
+                    timings[f"{stage}/{size}"] = stable_time(func) / len(texts)
+    finally:
+        app.google_translate, idiomcorpus.translate = saved
+    unit = min(unit, calibrate())
+
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)["stages"]
+    print(f"stages: translators stubbed, {', '.join(f'{size} = {count} x {words} words' for size, (words, count) in STAGE_SIZES.items())}")
+    regressions = []
+    for key, elapsed in timings.items():
+        relative = elapsed / unit
+        line = f"  {key:32s}: {elapsed * 1e3:10.4f} ms/request"
+        if key in baseline:
+            change = relative / baseline[key] - 1
+            line += f" ({change:+7.1%} vs baseline)"
+            if change > tolerance:
+                regressions.append(f"{key} {change:+.1%}")
+        print(line)
+
+    if save:
+        with open(baseline_path, "w") as f:
+            json.dump({"calibration_ms": unit * 1e3,
+                       "stages": {key: elapsed / unit for key, elapsed in timings.items()}}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"  baseline saved to {baseline_path}")
+    elif not baseline:
+        message = f"no baseline in {baseline_path}: run `python benchmark.py stages --save-baseline` on the reference machine"
+        if require:
+            raise SystemExit(f"stages: {message}")
+        print(f"  {message}")
+    elif regressions:
+        raise SystemExit(f"stages: slower than the baseline by more than {tolerance:.0%}: {', '.join(regressions)}")
+
+
+METRICS_MAX_OVERHEAD = 3e-6
+
+
+def bench_metrics():
+    """
+    Cost of recording one stage timing (decorator and context manager) and of rendering /metrics
+    """
+    histogram = metrics.Histogram('benchmark_seconds', 'Benchmark only.', 'stage')
+    calls = 200000
+
+    def bare():
+        return None
+
+    timed = histogram.timed('stage')(bare)
+
+    def with_timer():
+        with histogram.time('stage'):
+            pass
+
+    baseline = timeit(lambda: [bare() for _ in range(calls)])
+    decorated = timeit(lambda: [timed() for _ in range(calls)]) - baseline
+    block = timeit(lambda: [with_timer() for _ in range(calls)]) - baseline
+    for stage in ('translate', 'notation_lookup', 'idiom_match', 'mtranslate', 'sentiment', 'chart'):
+        histogram.observe(stage, 0.01)
+    render = timeit(lambda: histogram.render())
+    print(f"metrics: {calls} recordings")
+    print(f"  decorator        : {decorated / calls * 1e6:10.3f} us/call")
+    print(f"  context manager  : {block / calls * 1e6:10.3f} us/block")
+    print(f"  render           : {render * 1e3:10.3f} ms for 6 stage histograms")
+    # A streamed response tears its request down twice but is counted once
+    import app
+
+    saved, app.conversion_fun = app.conversion_fun, str.upper
+    try:
+        requests_before, in_flight_before = dict(metrics.requests_total.values), metrics.in_flight.value
+        with quiet():
+            response = app.app.test_client().post('/api/convert_file', data=b'ek\n\ndo', content_type='text/plain')
+            assert response.get_data() == b'EK\n\nDO\n\n'
+            response.close()
+    finally:
+        app.conversion_fun = saved
+    key = ('api_convert_file', 200)
+    assert metrics.requests_total.values.get(key, 0) - requests_before.get(key, 0) == 1
+    assert metrics.in_flight.value == in_flight_before
+
+    worst = max(decorated, block) / calls
+    if worst > METRICS_MAX_OVERHEAD:
+        raise SystemExit(f"metrics: recording costs {worst * 1e6:.2f} us (limit {METRICS_MAX_OVERHEAD * 1e6:.0f} us)")
+
+
+OFFLINE_BATCH_WORDS = 10000
+OFFLINE_BATCH_TARGET = 0.02
+
+
+def bench_offline():
+    """
+    Memory footprint of the offline lexicon and its throughput on a 10k-word batch
+    """
+    tracemalloc.start()
+    lexicon = offline_translation.Lexicon.from_file(offline_translation.LEXICON_PATH)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Phrases leave the subject to its own word, so it is translated once
+    for text in ("mai ghar ja rha hu", "main ghar ja raha hoon"):
+        assert lexicon.translate(text) == "I am going home", lexicon.translate(text)
+
+    words = sample_tokens(OFFLINE_BATCH_WORDS)
+    texts = [' '.join(words[i:i + 20]) for i in range(0, len(words), 20)]
+    elapsed = timeit(lambda: lexicon.translate_batch(texts))
+    translated = lexicon.translate(' '.join(words)).split()
+    unchanged = sum(1 for word in words if word in translated)
+    print(f"offline: {len(lexicon)} lexicon entries")
+    print(f"  memory           : {size / 1024:10.1f} KB resident ({peak / 1024:.1f} KB peak while loading)")
+    print(f"  {len(words)} words      : {elapsed * 1e3:10.2f} ms in {len(texts)} texts "
+          f"({len(words) / elapsed / 1e3:.0f} words/ms)")
+    print(f"  sample coverage  : {1 - unchanged / len(words):10.1%} of words translated")
+    if elapsed > OFFLINE_BATCH_TARGET:
+        raise SystemExit(f"offline: {len(words)} words took {elapsed * 1e3:.1f} ms "
+                         f"(target {OFFLINE_BATCH_TARGET * 1e3:.0f} ms)")
+
+
+BENCHMARKS = {
+    "async": bench_async,
+    "batch": bench_batch,
+    "cache": bench_cache,
+    "chart": bench_chart,
+    "concurrency": bench_concurrency,
+    "deadline": bench_deadline,
+    "dictionaries": bench_dictionaries,
+    "expansion": bench_expansion,
+    "fuzzy": bench_fuzzy,
+    "idioms": bench_idioms,
+    "jobs": bench_jobs,
+    "metrics": bench_metrics,
+    "notations": bench_notations,
+    "offline": bench_offline,
+    "retranslate": bench_retranslate,
+    "sentiment": bench_sentiment,
+    "soak": bench_soak,
+    "stages": bench_stages,
+    "startup": bench_startup,
+    "stream": bench_stream,
+    "tokens": bench_tokens,
+    "variants": bench_variants,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run converter micro-benchmarks")
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default: all): " + ", ".join(sorted(BENCHMARKS)))
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="per-stage baseline file (stages benchmark)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the stages timings as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="allowed slowdown against the baseline before stages fails (default: %(default)s)")
+    parser.add_argument("--require-baseline", action="store_true", help="fail the stages benchmark without a baseline")
+    args = parser.parse_intermixed_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    BENCHMARKS["stages"] = functools.partial(bench_stages, args.baseline, args.save_baseline, args.tolerance,
+                                             args.require_baseline)
+    failed = []
+    for name in args.names or sorted(BENCHMARKS):
+        # A failing benchmark does not keep the others from running
+        try:
+            BENCHMARKS[name]()
+        except AssertionError:
+            traceback.print_exc()
+            failed.append(name)
+        except SystemExit as e:
+            print(e, file=sys.stderr)
+            failed.append(name)
+    if failed:
+        raise SystemExit(f"failed: {', '.join(failed)}")
@@ -0,0 +1,65 @@
+import json
+import threading
+
+import resources
+
+# orjson is optional: it serializes the per-request data several times faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CATEGORIES = ['Negative', 'Neutral', 'Positive']
+COLORS = ['#FF6B6B', '#4ECDC4', '#45B7D1']
+
+template = None
+template_lock = threading.Lock()
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def figure_template():
+    """
+    Build the sentiment bar chart once without its data and cache it as
+    (static trace properties, serialized layout). The layout, including the
+    expanded plotly_white template, is the same for every request.
+    """
+    global template
+    if template is None:
+        with template_lock:
+            if template is None:
+                # Plotly is only needed here, once per process
+                go = resources.load_module('plotly.graph_objs')
+                fig = go.Figure(data=[
+                    go.Bar(
+                        x=CATEGORIES,
+                        marker_color=COLORS,
+                        textposition='auto',
+                        hoverinfo='text'
+                    )
+                ])
+                fig.update_layout(
+                    title='Sentiment Analysis Breakdown',
+                    xaxis_title='Sentiment Categories',
+                    yaxis_title='Percentage of Words',
+                    height=500,
+                    width=500,
+                    template='plotly_white'
+                )
+                figure = json.loads(json.dumps(fig, cls=resources.load_module('plotly.utils').PlotlyJSONEncoder))
+                template = (figure['data'][0], dumps(figure['layout']))
+    return template
+
+
+def sentiment_chart_json(bar_values, hover_text):
+    """
+    Plotly figure JSON of the sentiment breakdown; only the bar values, their
+    labels and the hover text are serialized per request
+    """
+    trace, layout = figure_template()
+    trace = dict(trace, y=bar_values, text=[f'{val:.2f}%' for val in bar_values], hovertext=hover_text)
+    return '{"data":[' + dumps(trace) + '],"layout":' + layout + '}'
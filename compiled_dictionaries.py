@@ -0,0 +1,291 @@
+"""
+The notation CSV and idioms.txt compiled into one versioned binary file of string
+tables (dictionaries.bin). Workers memory-map it: nothing is parsed at load, strings
+are decoded from the mapping when they are read, and the pages are shared by every
+process that maps the file.
+
+Rebuild it whenever the CSV or idioms.txt changes:
+
+    python compiled_dictionaries.py
+
+(the app also rebuilds a stale file itself when it finds the sources next to it).
+"""
+import csv
+import hashlib
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+
+import idiom_index
+
+FORMAT_VERSION = 1
+MAGIC = b'HGDICT\r\n'
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DICTIONARIES_PATH = os.path.join(BASE_DIR, "dictionaries.bin")
+NOTATIONS_CSV_PATH = os.path.join(BASE_DIR, "Short_Notations,Long_Notations---csv.csv")
+IDIOMS_PATH = os.path.join(BASE_DIR, "idioms.txt")
+# Table the notations used to be read from, compared with the CSV at build time
+DATABASE_PATH = os.path.join(BASE_DIR, "Database.db")
+
+# Magic, format version, number of tables, SHA-256 of everything after the header
+HEADER = struct.Struct('<8sII32s')
+# Per table: name, offset from the start of the file and size in bytes
+TABLE_ENTRY = struct.Struct('<16sQQ')
+# Per table: number of (key, value) pairs, whether they are sorted by key
+TABLE_HEADER = struct.Struct('<II')
+# Tables start on this boundary, so that their offset arrays can be viewed in place
+ALIGNMENT = 8
+
+
+class StringTable():
+    """
+    (key, value) string pairs over a buffer: a header, 2 * count + 1 little-endian uint32
+    offsets into the UTF-8 blob that follows (key i runs from offset 2i to 2i + 1, its
+    value from 2i + 1 to 2i + 2), then the blob. A sorted table is ordered by the UTF-8
+    bytes of its keys, without duplicates, and get() looks keys up by binary search.
+    """
+
+    def __init__(self, mapping, offset):
+        self.count, self.sorted = TABLE_HEADER.unpack_from(mapping, offset)
+        start = offset + TABLE_HEADER.size
+        end = start + 4 * (2 * self.count + 1)
+        # A view into the mapping, not a copy; strings are sliced from the mapping itself
+        self.offsets = memoryview(mapping)[start:end].cast('I')
+        self.mapping = mapping
+        self.base = end
+
+    @staticmethod
+    def pack(pairs, sorted_keys=False):
+        blob, offsets = bytearray(), [0]
+        for key, value in pairs:
+            for text in (key, value):
+                blob += text.encode('utf-8')
+                offsets.append(len(blob))
+        data = TABLE_HEADER.pack(len(pairs), sorted_keys) + struct.pack(f'<{len(offsets)}I', *offsets) + blob
+        return data + b'\0' * (-len(data) % ALIGNMENT)
+
+    def __len__(self):
+        return self.count
+
+    def string(self, pos):
+        return self.mapping[self.base + self.offsets[pos]:self.base + self.offsets[pos + 1]].decode('utf-8')
+
+    def __getitem__(self, pos):
+        if not 0 <= pos < self.count:
+            raise IndexError(pos)
+        return self.string(2 * pos), self.string(2 * pos + 1)
+
+    def __iter__(self):
+        for pos in range(self.count):
+            yield self[pos]
+
+    def release(self):
+        """
+        Drop the view into the mapping, so that the mapping can be closed
+        """
+        self.offsets.release()
+
+    def get(self, key, default=None):
+        """
+        Value of key in a sorted table (default if absent)
+        """
+        target = key.encode('utf-8')
+        offsets, mapping, base = self.offsets, self.mapping, self.base
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = mapping[base + offsets[2 * mid]:base + offsets[2 * mid + 1]]
+            if probe < target:
+                lo = mid + 1
+            elif probe > target:
+                hi = mid
+            else:
+                return self.string(2 * mid + 1)
+        return default
+
+
+class CompiledDictionaries():
+    """
+    A loaded dictionaries.bin. Its tables:
+      notations      folded short notation -> long notation, sorted (first CSV row per key)
+      notation_rows  short -> long notation in CSV order (for NotationTrie)
+      idioms         Hindi idiom -> English meaning in idioms.txt order (positions match the idiom index)
+      sources        source name -> SHA-256 of the file it was compiled from
+    """
+
+    def __init__(self, mapping, tables):
+        self.mapping = mapping
+        self.tables = tables
+        self.notations = tables['notations']
+        self.notation_rows = tables['notation_rows']
+        self.idioms = tables['idioms']
+        self.sources = dict(tables['sources'])
+
+
+def read_notations(path=NOTATIONS_CSV_PATH):
+    """
+    (short, long) rows of the notation CSV, in file order
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return [(row[0], row[1]) for row in reader if len(row) >= 2 and row[0]]
+
+
+def read_idioms(path=IDIOMS_PATH):
+    import idiomcorpus
+
+    store = idiomcorpus.IdiomStore.from_file(path)
+    return list(zip(store.hindi, store.english))
+
+
+def source_digests(notations_path=NOTATIONS_CSV_PATH, idioms_path=IDIOMS_PATH):
+    """
+    Digests of the sources that exist (a deployment may ship dictionaries.bin alone)
+    """
+    return {name: idiom_index.source_digest(path)
+            for name, path in (('notations', notations_path), ('idioms', idioms_path)) if os.path.exists(path)}
+
+
+def write(path, notation_rows, idioms, sources):
+    """
+    Compile the tables into path. The file is replaced, not rewritten, so processes that
+    mapped the previous one keep reading it until they reload.
+    """
+    folded = {}
+    for short, long in notation_rows:
+        folded.setdefault(short.lower(), long)
+    tables = [
+        ('notations', StringTable.pack(sorted(folded.items(), key=lambda item: item[0].encode('utf-8')), True)),
+        ('notation_rows', StringTable.pack(notation_rows)),
+        ('idioms', StringTable.pack(idioms)),
+        ('sources', StringTable.pack(sorted(sources.items()), True)),
+    ]
+    directory = bytearray()
+    offset = HEADER.size + TABLE_ENTRY.size * len(tables)
+    offset += -offset % ALIGNMENT
+    for name, data in tables:
+        directory += TABLE_ENTRY.pack(name.encode('ascii'), offset, len(data))
+        offset += len(data)
+    directory += b'\0' * (-(HEADER.size + len(directory)) % ALIGNMENT)
+    body = bytes(directory) + b''.join(data for _, data in tables)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(tables), hashlib.sha256(body).digest())
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, 'wb') as f:
+        f.write(header + body)
+    os.replace(temp, path)
+
+
+def build(path=DICTIONARIES_PATH, notations_path=NOTATIONS_CSV_PATH, idioms_path=IDIOMS_PATH):
+    write(path, read_notations(notations_path), read_idioms(idioms_path),
+          source_digests(notations_path, idioms_path))
+    return load(path)
+
+
+def load(path=DICTIONARIES_PATH, sources=None):
+    """
+    Map the compiled dictionaries at path. Returns None if the file is missing, corrupt
+    (checksum), from another format version or, when the digests of the current sources
+    are given, compiled from different ones.
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    dictionaries = None
+    try:
+        dictionaries = map_tables(mapping, path, sources)
+    finally:
+        if dictionaries is None:
+            mapping.close()
+    return dictionaries
+
+
+def map_tables(mapping, path, sources):
+    """
+    Check a mapped file and view its tables (None if it is not usable, see load())
+    """
+    if len(mapping) < HEADER.size:
+        print(f"Compiled dictionaries error: {path} is truncated")
+        return None
+    magic, version, count, checksum = HEADER.unpack_from(mapping)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        print(f"Compiled dictionaries {path} are from another version, rebuild them (run: python compiled_dictionaries.py)")
+        return None
+    if sys.byteorder != 'little':
+        print("Compiled dictionaries error: little-endian hosts only")
+        return None
+    with memoryview(mapping) as buffer:
+        if hashlib.sha256(buffer[HEADER.size:]).digest() != checksum:
+            print(f"Compiled dictionaries error: {path} fails its checksum")
+            return None
+    tables = {}
+    for pos in range(count):
+        name, offset, size = TABLE_ENTRY.unpack_from(mapping, HEADER.size + pos * TABLE_ENTRY.size)
+        if offset + size > len(mapping):
+            print(f"Compiled dictionaries error: {path} is truncated")
+            for table in tables.values():
+                table.release()
+            return None
+        tables[name.rstrip(b'\0').decode('ascii')] = StringTable(mapping, offset)
+    dictionaries = CompiledDictionaries(mapping, tables)
+    for name, digest in (sources or {}).items():
+        if dictionaries.sources.get(name) != digest:
+            print(f"Compiled dictionaries {path} are out of date, rebuild them (run: python compiled_dictionaries.py)")
+            for table in tables.values():
+                table.release()
+            return None
+    return dictionaries
+
+
+def load_current(path=DICTIONARIES_PATH, notations_path=NOTATIONS_CSV_PATH, idioms_path=IDIOMS_PATH):
+    """
+    Map the compiled dictionaries at path if they were compiled from the current sources.
+    A missing, corrupt or stale file is rebuilt from the sources first when both are there.
+    Returns None if neither works (callers then read the sources themselves).
+    """
+    sources = source_digests(notations_path, idioms_path)
+    dictionaries = load(path, sources)
+    if dictionaries is None and len(sources) == 2:
+        print(f"Rebuilding compiled dictionaries {path}")
+        try:
+            write(path, read_notations(notations_path), read_idioms(idioms_path), sources)
+        except (OSError, ValueError, csv.Error) as e:
+            print(f"Compiled dictionaries error: cannot rebuild {path}: {e}")
+            return None
+        dictionaries = load(path, sources)
+    return dictionaries
+
+
+def database_drift(rows, db_file=DATABASE_PATH):
+    """
+    Rows of the database's Keys table missing from the CSV rows, and CSV rows missing from it
+    """
+    try:
+        conn = sqlite3.connect(db_file)
+        try:
+            table = [tuple(row) for row in conn.execute("SELECT Short_Notations, Long_Notations FROM Keys ORDER BY rowid")
+                     if row[0]]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Database reading error: {e}")
+        return [], []
+    in_csv, in_table = set(rows), set(table)
+    return [row for row in table if row not in in_csv], [row for row in rows if row not in in_table]
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else DICTIONARIES_PATH
+    dictionaries = build(path)
+    print(f"{path}: {len(dictionaries.notations)} notations ({len(dictionaries.notation_rows)} rows), "
+          f"{len(dictionaries.idioms)} idioms, {len(dictionaries.mapping)} bytes")
+    only_database, only_csv = database_drift(list(dictionaries.notation_rows))
+    for row in only_database:
+        print(f"  in {DATABASE_PATH} but not in the CSV: {row[0]!r} -> {row[1]!r}")
+    for row in only_csv:
+        print(f"  in the CSV but not in {DATABASE_PATH}: {row[0]!r} -> {row[1]!r}")
@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+# Seconds a request may spend in network stages before they are skipped
+REQUEST_DEADLINE = 10.0
+
+# Consecutive failures that open a backend's circuit
+BREAKER_FAILURES = 5
+
+# Seconds an open circuit waits before letting one trial call through
+BREAKER_RESET = 30.0
+
+# A timed-out call is only blamed on the request's deadline, not on the backend, when the
+# deadline left it at least this fraction less time than the backend's own timeout
+DEADLINE_MARGIN = 0.1
+
+# Threads running one backend's guarded calls at the same time
+CALL_WORKERS = 16
+
+# Calls to one backend abandoned at their timeout that may still be running (each keeps
+# its thread until it returns) before new calls to it are refused instead of queued
+MAX_ABANDONED = 8
+
+
+class Unavailable(Exception):
+    """
+    A network stage that could not run (budget spent, call timed out or circuit open)
+    """
+
+
+class DeadlineExceeded(Unavailable):
+    pass
+
+
+class CircuitOpen(Unavailable):
+    pass
+
+
+class CallRefused(Unavailable):
+    """
+    A call that never started: too many abandoned calls, or no free thread before its timeout
+    """
+
+
+class Deadline():
+    """
+    Time budget of one request for its network stages, and the stages it had to skip
+    """
+
+    def __init__(self, seconds=REQUEST_DEADLINE, expires=None):
+        if expires is None and seconds is not None:
+            expires = time.monotonic() + seconds
+        self.expires = expires
+        self.skipped = []
+
+    def share(self):
+        """
+        A deadline with the same expiry and its own record of skipped stages (one per text of a batch)
+        """
+        return Deadline(expires=self.expires)
+
+    def remaining(self):
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def timeout(self, limit=None):
+        """
+        Timeout for the next call: what is left of the budget, capped at limit.
+        Raises DeadlineExceeded when the budget is spent.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        if remaining <= 0:
+            raise DeadlineExceeded("request deadline exceeded")
+        return remaining if limit is None else min(remaining, limit)
+
+    def skip(self, stage):
+        if stage not in self.skipped:
+            self.skipped.append(stage)
+
+    @property
+    def partial(self):
+        return bool(self.skipped)
+
+
+class CallPool():
+    """
+    Threads running the guarded calls of one backend, so that a hung backend cannot take
+    the threads of the others. A call abandoned at its timeout keeps its thread until it
+    returns: the pool has `max_abandoned` threads on top of `workers` for them, and while
+    that many are still running new calls are refused (CallRefused) instead of queued.
+    A forked worker process gets its own threads.
+    """
+
+    def __init__(self, name, workers=CALL_WORKERS, max_abandoned=MAX_ABANDONED):
+        self.name = name
+        self.workers = workers
+        self.max_abandoned = max_abandoned
+        self.abandoned = 0
+        self.executor = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def call_executor(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers + self.max_abandoned,
+                                                       thread_name_prefix=f'guarded-{self.name}')
+                    self.abandoned = 0
+                    self.pid = os.getpid()
+        return self.executor
+
+    def returned(self, future):
+        with self.lock:
+            self.abandoned -= 1
+
+    def call(self, func, timeout=None):
+        """
+        Run func() and return its result, giving up after timeout seconds (the call itself
+        cannot be interrupted, so it finishes in the background)
+        """
+        if timeout is None:
+            return func()
+        executor = self.call_executor()
+        if self.abandoned >= self.max_abandoned:
+            raise CallRefused(f"{self.name}: {self.abandoned} abandoned calls still running")
+        future = executor.submit(func)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise CallRefused(f"{self.name}: no free thread within {timeout:.2f}s") from None
+        with self.lock:
+            abandoned = not future.done()
+            if abandoned:
+                self.abandoned += 1
+        if abandoned:
+            # Run at once if the call returned meanwhile
+            future.add_done_callback(self.returned)
+        raise DeadlineExceeded(f"call timed out after {timeout:.2f}s")
+
+
+class CircuitBreaker():
+    """
+    Stop calling a backend after `failures` consecutive failures. Calls are refused
+    (CircuitOpen) for `reset` seconds, then a single trial call decides whether the
+    circuit closes again or stays open for another `reset` seconds. Calls run on the
+    backend's own CallPool; a call the pool refuses is not counted.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset=BREAKER_RESET, pool=None):
+        self.name = name
+        self.pool = pool or CallPool(name)
+        self.max_failures = failures
+        self.reset = reset
+        self.failures = 0
+        self.opened = None  # When the circuit opened (None while closed)
+        self.trial = False  # A trial call is in flight
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened >= self.reset else 'open'
+
+    def allow(self):
+        with self.lock:
+            if self.opened is None:
+                return True
+            if self.trial or time.monotonic() - self.opened < self.reset:
+                return False
+            self.trial = True
+            return True
+
+    def release(self):
+        """
+        End a call that says nothing about the backend (the circuit stays as it is)
+        """
+        with self.lock:
+            self.trial = False
+
+    def record(self, ok):
+        with self.lock:
+            self.trial = False
+            if ok:
+                self.failures = 0
+                self.opened = None
+            else:
+                self.failures += 1
+                if self.failures >= self.max_failures or self.opened is not None:
+                    self.opened = time.monotonic()
+
+    def call(self, func, timeout=None, limit=None):
+        """
+        Call func() through the breaker, giving up after timeout seconds. `limit` is the
+        backend's own timeout: a call given clearly less time (by a request deadline, see
+        DEADLINE_MARGIN) that runs out of it is not counted as a failure of the backend.
+        """
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} circuit is open")
+        try:
+            result = self.pool.call(func, timeout)
+        except CallRefused:
+            # The backend was never called
+            self.release()
+            raise
+        except DeadlineExceeded:
+            if limit is not None and timeout is not None and timeout < limit * (1 - DEADLINE_MARGIN):
+                self.release()
+            else:
+                self.record(False)
+            raise
+        except Exception:
+            self.record(False)
+            raise
+        self.record(True)
+        return result
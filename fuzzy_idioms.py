@@ -0,0 +1,210 @@
+"""
+Fuzzy idiom detection: MinHash signatures of the character shingles of an idiom's
+words, bucketed by locality-sensitive hashing, so that inflected or misspelled idioms
+are found without scoring the whole corpus. Candidates are then ranked by how well
+each of their words is matched by a word of the input.
+"""
+import functools
+import random
+import zlib
+
+import idiom_index
+
+# MinHash functions per signature, split into BANDS bands of NUM_PERM // BANDS rows;
+# two shingle sets collide in a band with probability about jaccard ** rows
+NUM_PERM = 48
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Characters per shingle
+SHINGLE_SIZE = 3
+
+# Least similarity (mean over the idiom's words of the Jaccard similarity of their
+# shingles with the closest input word) for a candidate to count as a match
+THRESHOLD = 0.55
+
+# Least similarity of an input word to an idiom word for it to be part of the match
+WORD_THRESHOLD = 0.4
+
+# Input windows, in content words (stop words left out, as in the idiom forms)
+WINDOW = 6
+
+# Forms with fewer content words are too short to be matched approximately
+MIN_WORDS = 3
+
+# Longest input (in words) searched approximately after translation: the search costs
+# about 20 us per word, and longer texts are only matched exactly
+MAX_INPUT_WORDS = 48
+
+PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+# Hash functions (a * h + b) % PRIME, from a fixed seed so that signatures are the same in every process
+PERMUTATIONS = [(random.Random(seed).randrange(1, PRIME), random.Random(-seed).randrange(0, PRIME))
+                for seed in range(1, NUM_PERM + 1)]
+
+
+@functools.lru_cache(maxsize=65536)
+def shingles(key):
+    """
+    Character shingles of a word key, with its start and end marked
+    """
+    padded = f'^{key}$'
+    if len(padded) <= SHINGLE_SIZE:
+        return frozenset([padded])
+    return frozenset(padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1))
+
+
+@functools.lru_cache(maxsize=65536)
+def shingle_hashes(shingle):
+    h = zlib.crc32(shingle.encode('utf-8'))
+    return tuple(((a * h + b) % PRIME) & MAX_HASH for a, b in PERMUTATIONS)
+
+
+@functools.lru_cache(maxsize=65536)
+def signature(key):
+    """
+    MinHash signature of one word key; the signature of several words (or shingles)
+    is the element-wise minimum of theirs
+    """
+    return combine([shingle_hashes(shingle) for shingle in shingles(key)])
+
+
+def combine(signatures):
+    return signatures[0] if len(signatures) == 1 else tuple(map(min, *signatures))
+
+
+def bands(sig):
+    return [(band, sig[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+@functools.lru_cache(maxsize=262144)
+def word_similarity(a, b):
+    return jaccard(shingles(a), shingles(b))
+
+
+def alignment(keys, window):
+    """
+    Similarity of an idiom form's keys to a window of (position, key) input words, and the
+    index in the window of the word matched to each key (None for keys matched by none)
+    """
+    total, aligned = 0.0, []
+    for key in keys:
+        score, index = max((word_similarity(key, word), index) for index, (_, word) in enumerate(window))
+        total += score
+        aligned.append(index if score >= WORD_THRESHOLD else None)
+    return total / len(keys), aligned
+
+
+class FuzzyIdiomIndex():
+    """
+    LSH index over the idiom forms of an idiom_index.VariantIndex. A query slides
+    windows over the input's content words, collects the forms sharing a band with any
+    window, then scores only those candidates with alignment().
+    """
+
+    def __init__(self, variants):
+        self.variants = variants
+        self.keys = {}
+        self.buckets = {}
+        for pos, (_, _, _, keys) in enumerate(variants.variants):
+            if len(keys) < MIN_WORDS:
+                continue
+            self.keys[pos] = keys
+            sig = combine([signature(key) for key in keys])
+            for band in bands(sig):
+                self.buckets.setdefault(band, []).append(pos)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def content(words):
+        """
+        The (position, key) pairs of the content words of words
+        """
+        content = []
+        for pos, word in enumerate(words):
+            if idiom_index.is_devanagari(word):
+                continue
+            key = idiom_index.roman_key(word)
+            if key and key not in idiom_index.STOP_KEYS:
+                content.append((pos, key))
+        return content
+
+    @staticmethod
+    def windows(content):
+        """
+        Start of every window of WINDOW content words (a single shorter one for shorter input)
+        """
+        return range(max(1, len(content) - WINDOW + 1)) if content else range(0)
+
+    def score(self, pos, content, start, forms, best):
+        """
+        Score form pos against the window of content starting at start, keeping its best score in best
+        """
+        idiom, form, length, keys = self.variants.variants[pos]
+        if form not in forms:
+            return
+        score, aligned = alignment(keys, content[start:start + WINDOW])
+        matched = [start + index for index in aligned if index is not None]
+        if len(matched) < MIN_WORDS or score <= best.get(pos, (0.0,))[0]:
+            return
+        # Words of the form before its first matched key and after its last one, too
+        # misspelled to match, are taken to be the input words next to the matched ones
+        leading = next(i for i, index in enumerate(aligned) if index is not None)
+        trailing = next(i for i, index in enumerate(reversed(aligned)) if index is not None)
+        first = content[max(0, min(matched) - leading)][0]
+        last = content[min(len(content) - 1, max(matched) + trailing)][0] + 1
+        if last - first <= length + idiom_index.MAX_GAP:
+            best[pos] = (score, first, last)
+
+    def candidates(self, words, threshold=THRESHOLD, forms=idiom_index.FORMS):
+        """
+        Idiom forms similar to a window of the input, best first, as idiom_index.IdiomMatch
+        objects whose coverage is their similarity (at least threshold)
+        """
+        best = {}
+        content = self.content(words)
+        for start in self.windows(content):
+            sig = combine([signature(key) for _, key in content[start:start + WINDOW]])
+            seen = set()
+            for band in bands(sig):
+                for pos in self.buckets.get(band, ()):
+                    if pos not in seen:
+                        seen.add(pos)
+                        self.score(pos, content, start, forms, best)
+        return ranked(self.variants, best, threshold)
+
+    def brute_force(self, words, threshold=THRESHOLD, forms=idiom_index.FORMS):
+        """
+        candidates() without the LSH buckets: every form is scored against every window
+        """
+        best = {}
+        content = self.content(words)
+        for start in self.windows(content):
+            for pos in self.keys:
+                self.score(pos, content, start, forms, best)
+        return ranked(self.variants, best, threshold)
+
+    def match(self, words, threshold=THRESHOLD, forms=idiom_index.FORMS):
+        """
+        The most similar idiom form, or None if none reaches the threshold
+        """
+        matches = self.candidates(words, threshold, forms)
+        return matches[0] if matches else None
+
+
+def ranked(variants, best, threshold):
+    matches = []
+    for pos, (score, first, last) in best.items():
+        if score >= threshold:
+            matches.append(idiom_index.IdiomMatch(variants.variants[pos][0], variants.variants[pos][1],
+                                                  first, last, score))
+    matches.sort(key=lambda match: -match.coverage)
+    return matches
+
@@ -0,0 +1,223 @@
+"""
+Idiom index over the Roman forms of every idiom: its ITRANS transliteration (which
+also matches Roman Hinglish as people type it) and its English gloss.
+
+Build it offline whenever idioms.txt changes; load_idioms() loads it at start-up:
+
+    python idiom_index.py [idioms.txt]
+"""
+import functools
+import hashlib
+import json
+import os
+import re
+import sys
+
+import resources
+
+INDEX_VERSION = 1
+
+# Forms of an idiom indexed here (the Devanagari keys are matched by IdiomIndex)
+FORMS = ('roman', 'english')
+
+# A form matches when at least this share of its words, and MIN_MATCHED of them, are in the input
+MIN_COVERAGE = 0.75
+MIN_MATCHED = 2
+
+# Extra tokens allowed between the first and last matched word of a form
+MAX_GAP = 2
+
+DEVANAGARI = re.compile('[ऀ-ॿ]')
+NOT_LETTERS = re.compile('[^a-z]')
+
+# Spelling variants of Roman Hinglish (and ITRANS) folded together, in this order
+ROMAN_FOLDS = [
+    (re.compile('aa'), 'a'), (re.compile('ee|ii'), 'i'), (re.compile('oo|uu'), 'u'),
+    (re.compile('chh'), 'ch'), (re.compile('w'), 'v'), (re.compile('z'), 'j'),
+    (re.compile('ph'), 'f'), (re.compile('q'), 'k'),
+    # Inherent and long a are written or left out at will, except at the start of a word
+    (re.compile('(?<=.)a'), ''),
+    # Final nasal (anusvara, chandrabindu): nahin / nahi / nahIM
+    (re.compile('(?<=[eiou])[mn]$'), ''),
+    (re.compile('ei$'), 'e'),
+    (re.compile(r'(.)\1'), r'\1'),
+]
+
+# Words too common to tell idioms apart (matched as keys, so in Roman and English spelling)
+STOP_WORDS = ('hai hain ka ki ke ko se me mein main to hi bhi na ek aur ya jo tha thi the '
+              'a an of to in on is are was be it its and or by for with as at one no not you your')
+
+
+def is_devanagari(token):
+    return DEVANAGARI.search(token) is not None
+
+
+@functools.lru_cache(maxsize=65536)
+def roman_key(word):
+    """
+    Key of a Roman word: lowercased letters with the usual spelling variants folded
+    """
+    key = NOT_LETTERS.sub('', word.lower())
+    for pattern, replacement in ROMAN_FOLDS:
+        key = pattern.sub(replacement, key)
+    return key
+
+
+STOP_KEYS = frozenset(roman_key(word) for word in STOP_WORDS.split())
+
+
+def form_keys(words):
+    """
+    Keys of a form's words that count towards a match (stop words and empty keys left out)
+    """
+    keys = []
+    for word in words:
+        key = roman_key(word)
+        if key and key not in STOP_KEYS and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def idiom_forms(hindi, english):
+    """
+    The Roman forms of one idiom as {form: words}
+    """
+    sanscript = resources.load_module('indic_transliteration.sanscript')
+    return {
+        'roman': sanscript.transliterate(hindi, sanscript.DEVANAGARI, sanscript.ITRANS).split(),
+        'english': english.split(),
+    }
+
+
+def source_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class IdiomMatch():
+    """
+    An idiom found in a token list: its position in the corpus, the form that matched
+    and the tokens [first, last) it spans
+    """
+
+    def __init__(self, idiom, form, first, last, coverage):
+        self.idiom, self.form = idiom, form
+        self.first, self.last = first, last
+        self.coverage = coverage
+
+
+class VariantIndex():
+    """
+    Key -> forms inverted index; matching probes it once per input token
+    """
+
+    def __init__(self, variants):
+        # (idiom position, form, number of words, keys) per indexed form
+        self.variants = variants
+        self.postings = {}
+        for pos, (_, _, _, keys) in enumerate(variants):
+            for key in keys:
+                self.postings.setdefault(key, []).append(pos)
+
+    @classmethod
+    def build(cls, hindi, english):
+        variants = []
+        for pos, (idiom, meaning) in enumerate(zip(hindi, english)):
+            for form, words in idiom_forms(idiom, meaning).items():
+                keys = form_keys(words)
+                if keys:
+                    variants.append((pos, form, len(words), tuple(keys)))
+        return cls(variants)
+
+    def save(self, path, source):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'source': source,
+                       'variants': [list(variant) for variant in self.variants]}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, source):
+        """
+        The index saved at path, or None if it is missing, from another version or
+        built from a different idioms.txt (source is the digest of the current one)
+        """
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != INDEX_VERSION or data.get('source') != source:
+            return None
+        return cls([(pos, form, length, tuple(keys)) for pos, form, length, keys in data['variants']])
+
+    def __len__(self):
+        return len(self.variants)
+
+    def match(self, words, forms=FORMS):
+        """
+        Best matching idiom form among the given forms, or None
+        """
+        hits = {}
+        for pos, word in enumerate(words):
+            if is_devanagari(word):
+                continue
+            key = roman_key(word)
+            for variant in self.postings.get(key, ()):
+                # First position of every key of the form found in the input
+                hits.setdefault(variant, {}).setdefault(key, pos)
+        best, best_score, best_length = None, (0, 0), 0
+        for variant, found in hits.items():
+            idiom, form, length, keys = self.variants[variant]
+            if form not in forms or len(found) < min(MIN_MATCHED, len(keys)):
+                continue
+            coverage = len(found) / len(keys)
+            first, last = min(found.values()), max(found.values()) + 1
+            if coverage < MIN_COVERAGE or last - first > length + MAX_GAP:
+                continue
+            if (coverage, len(found)) > best_score:
+                best_score, best_length = (coverage, len(found)), length
+                best = IdiomMatch(idiom, form, first, last, coverage)
+        if best is not None:
+            # Stop words next to the matched words are part of the idiom while it has words left
+            while best.last - best.first < best_length and best.last < len(words) and \
+                    roman_key(words[best.last]) in STOP_KEYS:
+                best.last += 1
+            while best.last - best.first < best_length and best.first > 0 and \
+                    roman_key(words[best.first - 1]) in STOP_KEYS:
+                best.first -= 1
+        return best
+
+
+def index_path(idioms_path):
+    return os.path.splitext(idioms_path)[0] + '.index.json'
+
+
+def load_index(idioms_path, hindi, english):
+    """
+    Load the index built for idioms_path, building it here if it is missing or stale
+    """
+    path = index_path(idioms_path)
+    source = source_digest(idioms_path)
+    index = VariantIndex.load(path, source)
+    if index is None:
+        print(f"Idiom index {path} is missing or out of date, building it (run: python idiom_index.py)")
+        try:
+            index = VariantIndex.build(hindi, english)
+        except ImportError as e:
+            print(f"Idiom index error: {e}")
+            return None
+    return index
+
+
+def build(idioms_path):
+    import idiomcorpus
+
+    store = idiomcorpus.IdiomStore.from_file(idioms_path)
+    index = VariantIndex.build(store.hindi, store.english)
+    index.save(index_path(idioms_path), source_digest(idioms_path))
+    return index
+
+
+if __name__ == '__main__':
+    idioms_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "idioms.txt")
+    index = build(idioms_path)
+    print(f"{index_path(idioms_path)}: {len(index)} forms of {len(set(v[0] for v in index.variants))} idioms")
@@ -1,59 +1,190 @@
 import codecs
+import os
 import re
 import codecs
 import string
+import threading
 from mtranslate import translate
 
+import compiled_dictionaries
+import fuzzy_idioms
+import idiom_index
+import tokenstream
+
+IDIOMS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "idioms.txt")
+
+
+class IdiomIndex():
+    """
+    Token -> idiom inverted index, so that only idioms sharing a token with the input are scored
+    """
+
+    def __init__(self, idioms, tokenize):
+        self.idioms = []
+        self.tokens = []
+        self.postings = {}
+        for pos, idiom in enumerate(idioms):
+            idiom = re.sub(' +', ' ', idiom.strip())
+            # Same unique-token list (and order) that idiom_match used to be given
+            idiomtoken = list(set(tokenize(idiom)))
+            self.idioms.append(idiom)
+            self.tokens.append(idiomtoken)
+            for token in idiomtoken:
+                self.postings.setdefault(token, []).append(pos)
+
+    def __len__(self):
+        return len(self.idioms)
+
+    def overlap(self, inputtoken):
+        """
+        Number of shared tokens for every idiom that shares at least one token with the input
+        """
+        counts = {}
+        for token in inputtoken:
+            for pos in self.postings.get(token, ()):
+                counts[pos] = counts.get(pos, 0) + 1
+        return counts
+
+
+class IdiomStore():
+    """
+    Immutable idiom corpus (Hindi idioms, English meanings and their inverted index).
+    `variants` indexes their Roman and English forms (idiom_index.VariantIndex), and
+    `fuzzy` finds those forms misspelled or inflected (fuzzy_idioms.FuzzyIdiomIndex).
+    """
+
+    def __init__(self, hindi, english, variants=None, fuzzy=None):
+        self.hindi = tuple(hindi)
+        self.english = tuple(english)
+        self.index = IdiomIndex(self.hindi, Idiomcorpus.idiom_tokenize)
+        self.variants = variants
+        self.fuzzy = fuzzy
+        # First position of every idiom, as list.index() used to return
+        self.positions = {}
+        for pos, idiom in enumerate(self.hindi):
+            self.positions.setdefault(idiom, pos)
+
+    @classmethod
+    def from_file(cls, path):
+        hindi, english = [], []
+        with codecs.open(path, encoding="utf-8", mode="r") as fin:
+            for line in fin:
+                a, b = line.split('-')
+                hindi.append(re.sub(' +', ' ', a.strip()))
+                english.append(re.sub(' +', ' ', b.strip()))
+        return cls(hindi, english)
+
+    def meaning(self, idiom):
+        return self.english[self.positions[idiom]]
+
+
+store = None
+store_lock = threading.Lock()
+
+
+def load_idioms(path=IDIOMS_PATH):
+    """
+    Return the process-wide idiom store, reading idioms.txt on first use only (from the
+    compiled dictionaries, if they are up to date)
+    """
+    global store
+    if store is None:
+        with store_lock:
+            if store is None:
+                store = load_store(path)
+                store.variants = idiom_index.load_index(path, store.hindi, store.english)
+                if store.variants is not None:
+                    store.fuzzy = fuzzy_idioms.FuzzyIdiomIndex(store.variants)
+    return store
+
+
+def load_store(path=IDIOMS_PATH):
+    if path == IDIOMS_PATH:
+        dictionaries = compiled_dictionaries.load_current()
+        if dictionaries is not None:
+            return IdiomStore([idiom for idiom, _ in dictionaries.idioms], [meaning for _, meaning in dictionaries.idioms])
+    return IdiomStore.from_file(path)
+
 
 class Idiomcorpus():
-    flag = False
-    hindi, english = [], []
-    input, output = '', ''
-    hidiom, eidiom = '', ''
-
-    def idiom_init(self, sentence):
-        if self.flag is False:
-            self.flag = True
-            with codecs.open("idioms.txt", encoding="utf-8", mode="r") as fin:
-                for line in fin:
-                    a, b = line.split('-')
-                    self.hindi.append(re.sub(' +', ' ', a.strip()))
-                    self.english.append(re.sub(' +', ' ', b.strip()))
-            fin.close()
-            self.input = sentence
-            self.input = re.sub(' +', ' ', self.input.strip())
-
-    def idiom_tokenize(self, sentence):
-        tokens, word = [], []
-        for char in sentence:
-            if char == ' ':
-                tokens.append(''.join(word))
-                word = []
-            else:
-                word.append(char)
-        tokens.append(''.join(word))
-        return tokens
+
+    def __init__(self, store=None):
+        self.store = store
+        self.input, self.output = '', ''
+        self.hidiom, self.eidiom = '', ''
+        self.stream = None
+        # Idiom found through its Roman or English form (an idiom_index.IdiomMatch)
+        self.match = None
+
+    @property
+    def hindi(self):
+        return self.store.hindi
+
+    @property
+    def english(self):
+        return self.store.english
+
+    def idiom_index(self):
+        """
+        Return the inverted index over the loaded idioms
+        """
+        return self.store.index
+
+    def idiom_init(self, sentence, stream=None):
+        """
+        Set the input sentence. `stream` may carry its tokens from an earlier stage
+        (a TokenStream whose text() is the sentence); it is then edited in place.
+        """
+        if self.store is None:
+            self.store = load_idioms()
+        if stream is not None:
+            self.input, self.stream = sentence, stream
+            return
+        self.input = sentence
+        self.input = re.sub(' +', ' ', self.input.strip())
+        self.stream = tokenstream.TokenStream.split(self.input)
+
+    @staticmethod
+    def idiom_tokenize(sentence):
+        return sentence.split(' ')
 
     def check_idiom(self):
         unicount, uniidiom = 0, ''
-        inputtoken = list(set(self.idiom_tokenize(self.input)))
-        for idiom in self.hindi:
-            idiom = re.sub(' +', ' ', idiom.strip())
-            idiomtoken = list(set(self.idiom_tokenize(idiom)))
-            counter = self.idiom_match(inputtoken, idiomtoken)
+        inputtoken = list(set(self.stream.words))
+        inputset = set(inputtoken)
+        index = self.idiom_index()
+        # The idiom keys are Devanagari: other tokens are looked up in the variant index instead
+        overlap = index.overlap(token for token in inputset if idiom_index.is_devanagari(token))
+        # Idioms without a shared token score 0 and can never be picked, so skip them
+        for pos in sorted(overlap):
+            idiom = index.idioms[pos]
+            idiomtoken = index.tokens[pos]
+            # Same score as idiom_match: shared tokens, if the idiom's first token is in the input
+            counter = overlap[pos] if idiomtoken[0] in inputset else 0
             if counter <= len(inputtoken) and counter <= len(idiomtoken):
                 if counter > unicount and len(idiomtoken) <= len(inputtoken):
                     unicount = counter
                     uniidiom = idiom
                     print("21",idiom)
+        self.match = None
+        if not uniidiom and self.store.variants is not None:
+            self.match = self.store.variants.match(self.stream.words)
+            # Inflected idioms are made of known words too, so short texts are always searched
+            if (self.match is None and self.store.fuzzy is not None
+                    and len(self.stream.words) <= fuzzy_idioms.MAX_INPUT_WORDS):
+                self.match = self.store.fuzzy.match(self.stream.words)
+            if self.match is not None:
+                uniidiom = self.hindi[self.match.idiom]
         self.hidiom = uniidiom
         return self.hidiom
 
     def idiom_convert(self):
         if not self.hidiom:
             self.eidiom = ''
+        elif self.match is not None:
+            self.eidiom = self.english[self.match.idiom].split(' ')
         else:
-            self.eidiom = self.english[self.hindi.index(self.hidiom)].split(' ')
+            self.eidiom = self.store.meaning(self.hidiom).split(' ')
         return self.eidiom
 
     def idiom_match(self, input, idiom):
@@ -64,26 +195,21 @@ class Idiomcorpus():
                     counter += 1
         return counter
 
-    def idiom_display(self):
-        inputsplit = self.idiom_tokenize(self.input)
-        hidiomsplit = self.idiom_tokenize(self.hidiom)
-        eidiomsplit = self.idiom_tokenize(self.eidiom)
-        outputsplit = inputsplit
-
-        if hidiomsplit[0] in inputsplit:
-            temp = inputsplit.index(hidiomsplit[0])
-            for word in self.eidiom:
-                outputsplit[temp] = word
-                temp += 1
-
-            for word in hidiomsplit:
-                if word in inputsplit:
-                    outputsplit.remove(word)
-        else:
+    def idiom_substitute(self):
+        """
+        Replace the detected idiom in the input by its English meaning, without translating
+        """
+        if self.match is not None:
+            # The tokens of the matched form, and any between them, make way for the meaning
+            self.stream.replace_runs([(self.match.first, self.match.last)], [self.eidiom])
+        elif not self.stream.substitute(self.idiom_tokenize(self.hidiom), self.eidiom):
             self.hidiom = ''
             self.eidiom = 'Not Found'
 
-        self.output = ' '.join(outputsplit)
-        self.output = translate(self.output, 'en')
+        self.output = self.stream.text()
+        return self.output
+
+    def idiom_display(self):
+        self.output = translate(self.idiom_substitute(), 'en')
         print(self.output)
         return self.output
\ No newline at end of file
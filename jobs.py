@@ -0,0 +1,315 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from sqlite3 import Error
+
+import streaming
+
+# Worker processes converting files in the background
+JOB_WORKERS = 2
+
+# A running job whose progress was not updated for this many seconds is
+# considered abandoned (its process died) and is queued again
+STALE_SECONDS = 120
+
+# Seconds between two heartbeats of a running job, also while one paragraph is converted
+HEARTBEAT_SECONDS = 15
+
+# Seconds between two checks for jobs abandoned by a dead worker process
+RECOVER_INTERVAL = 10.0
+
+BOOT_ID_PATH = '/proc/sys/kernel/random/boot_id'
+
+
+def boot_id():
+    """
+    Identifier of the current boot of this machine ('' where the OS does not expose one)
+    """
+    try:
+        with open(BOOT_ID_PATH) as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+def process_owner():
+    """
+    Owner recorded on the jobs this process claims
+    """
+    return f"{boot_id()}:{os.getpid()}"
+
+
+def owner_alive(owner):
+    """
+    Whether the process that claimed a job still runs (unknown owners count as alive,
+    and are left to the STALE_SECONDS heartbeat check)
+    """
+    if not owner:
+        return True
+    boot, _, pid = owner.rpartition(':')
+    if boot != boot_id():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    # A killed worker stays a zombie until its new parent reaps it
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rpartition(')')[2].split()[0] != 'Z'
+    except (OSError, IndexError):
+        return True
+
+
+def connect(db_file):
+    conn = sqlite3.connect(db_file, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def create_table(db_file):
+    conn = connect(db_file)
+    try:
+        conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                            id TEXT PRIMARY KEY,
+                            status TEXT NOT NULL,
+                            total INTEGER NOT NULL DEFAULT 0,
+                            done INTEGER NOT NULL DEFAULT 0,
+                            result_bytes INTEGER NOT NULL DEFAULT 0,
+                            error TEXT,
+                            created REAL NOT NULL,
+                            updated REAL NOT NULL,
+                            owner TEXT)""")
+        # Tables created before jobs recorded their owner
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if 'owner' not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+    finally:
+        conn.close()
+
+
+def count_paragraphs(path):
+    with open(path, 'rb') as f:
+        return sum(1 for _ in streaming.read_paragraphs(f))
+
+
+def heartbeat(db_file, job_id, owner, stop, interval=HEARTBEAT_SECONDS):
+    """
+    Refresh a running job's updated time every interval seconds until stop is set
+    """
+    while not stop.wait(interval):
+        try:
+            conn = connect(db_file)
+            try:
+                conn.execute("UPDATE jobs SET updated = ? WHERE id = ? AND status = 'running' AND owner = ?",
+                             (time.time(), job_id, owner))
+            finally:
+                conn.close()
+        except Error as e:
+            print(f"Job {job_id} heartbeat error: {e}")
+
+
+def run_job(db_file, folder, job_id, convert):
+    """
+    Convert one job's input file paragraph by paragraph (runs in a worker process).
+
+    Progress is saved after every paragraph together with the size of the result
+    file, so a job interrupted by a restart continues where it stopped. The job
+    records this process as its owner and a heartbeat keeps it fresh meanwhile.
+    """
+    input_path = os.path.join(folder, job_id + '.txt')
+    result_path = os.path.join(folder, job_id + '.out.txt')
+    owner = process_owner()
+    stop = threading.Event()
+    conn = connect(db_file)
+    try:
+        claimed = conn.execute("UPDATE jobs SET status = 'running', updated = ?, owner = ? "
+                               "WHERE id = ? AND status = 'queued'", (time.time(), owner, job_id)).rowcount
+        if not claimed:
+            return  # Already taken by another worker
+        threading.Thread(target=heartbeat, args=(db_file, job_id, owner, stop),
+                         name='job-heartbeat', daemon=True).start()
+        done, result_bytes = conn.execute("SELECT done, result_bytes FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.execute("UPDATE jobs SET total = ? WHERE id = ?", (count_paragraphs(input_path), job_id))
+
+        with open(input_path, 'rb') as fin, open(result_path, 'ab') as fout:
+            # Drop anything written after the last saved progress
+            fout.truncate(result_bytes)
+            fout.seek(result_bytes)
+            paragraphs = streaming.read_paragraphs(fin)
+            for _ in range(done):
+                next(paragraphs, None)
+            for converted in streaming.convert_paragraphs(paragraphs, convert):
+                fout.write(converted.encode('utf-8'))
+                fout.flush()
+                done += 1
+                conn.execute("UPDATE jobs SET done = ?, result_bytes = ?, updated = ? WHERE id = ?",
+                             (done, fout.tell(), time.time(), job_id))
+        conn.execute("UPDATE jobs SET status = 'done', updated = ? WHERE id = ?", (time.time(), job_id))
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        conn.execute("UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                     (str(e), time.time(), job_id))
+    finally:
+        stop.set()
+        conn.close()
+
+
+def requeue_abandoned(conn, stale_seconds=STALE_SECONDS):
+    """
+    Queue again the running jobs whose owner process is gone, or whose heartbeat stopped.
+    Returns their ids.
+    """
+    requeued = []
+    now = time.time()
+    for job_id, owner, updated in conn.execute("SELECT id, owner, updated FROM jobs WHERE status = 'running'").fetchall():
+        if owner_alive(owner) and updated >= now - stale_seconds:
+            continue
+        # Only one process requeues a job, even if several notice it at once
+        if conn.execute("UPDATE jobs SET status = 'queued', owner = NULL WHERE id = ? AND status = 'running' "
+                        "AND updated = ? AND owner IS ?", (job_id, updated, owner)).rowcount:
+            requeued.append(job_id)
+    return requeued
+
+
+class JobQueue():
+    """
+    Background conversion jobs: a SQLite job table plus a local process pool.
+
+    `convert` must be a module-level function (it is sent to the worker processes).
+    Input and result files are kept in `folder`. The pool is started lazily in each
+    process that uses the queue; starting it also resumes unfinished jobs. Jobs whose
+    worker died meanwhile are resumed on the next submit or status call after
+    RECOVER_INTERVAL seconds. A pool worker that dies breaks the whole pool: it is
+    started again, with its jobs, on the next call.
+    """
+
+    def __init__(self, db_file, folder, convert, workers=JOB_WORKERS):
+        self.db_file = db_file
+        self.folder = folder
+        self.convert = convert
+        self.workers = workers
+        self.executor = None
+        self.pid = None
+        self.broken = False
+        self.next_recover = 0.0
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        create_table(db_file)
+
+    def start(self):
+        """
+        Start the worker pool in this process (once, or again if it broke) and resubmit
+        unfinished jobs
+        """
+        if self.pid == os.getpid() and not self.broken:
+            return
+        with self.lock:
+            if self.pid == os.getpid() and not self.broken:
+                return
+            if self.pid == os.getpid():
+                print("Job pool broken (a worker process died), starting a new one")
+                self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            self.pid = os.getpid()
+            self.broken = False
+            self.next_recover = time.monotonic() + RECOVER_INTERVAL
+            try:
+                conn = connect(self.db_file)
+                try:
+                    requeue_abandoned(conn)
+                    pending = [row[0] for row in conn.execute(
+                        "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created")]
+                finally:
+                    conn.close()
+            except Error as e:
+                print(f"Job resume error: {e}")
+                pending = []
+        for job_id in pending:
+            if not self.submit_job(job_id):
+                break
+
+    def submit_job(self, job_id):
+        """
+        Send a queued job to the pool. Returns False if the pool is broken (the job stays
+        queued and is sent to the next pool).
+        """
+        try:
+            future = self.executor.submit(run_job, self.db_file, self.folder, job_id, self.convert)
+        except BrokenProcessPool:
+            self.broken = True
+            return False
+        future.add_done_callback(self.job_done)
+        return True
+
+    def job_done(self, future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self.broken = True
+
+    def recover(self):
+        """
+        Start a new pool if the current one broke, and resubmit the jobs abandoned by a
+        dead worker (at most every RECOVER_INTERVAL seconds)
+        """
+        self.start()
+        now = time.monotonic()
+        if now < self.next_recover:
+            return
+        self.next_recover = now + RECOVER_INTERVAL
+        try:
+            conn = connect(self.db_file)
+            try:
+                requeued = requeue_abandoned(conn)
+            finally:
+                conn.close()
+        except Error as e:
+            print(f"Job resume error: {e}")
+            return
+        for job_id in requeued:
+            if not self.submit_job(job_id):
+                break
+
+    def submit(self, stream, chunk_size=streaming.CHUNK_SIZE):
+        """
+        Save an uploaded binary stream as a new job and queue it; returns the job id
+        """
+        self.recover()
+        job_id = uuid.uuid4().hex
+        with open(os.path.join(self.folder, job_id + '.txt'), 'wb') as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+        now = time.time()
+        conn = connect(self.db_file)
+        try:
+            conn.execute("INSERT INTO jobs (id, status, created, updated) VALUES (?, 'queued', ?, ?)",
+                         (job_id, now, now))
+        finally:
+            conn.close()
+        if not self.submit_job(job_id):
+            self.start()
+        return job_id
+
+    def status(self, job_id):
+        """
+        Return the job row as a dictionary, or None for an unknown id
+        """
+        self.recover()
+        conn = connect(self.db_file)
+        try:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT id, status, total, done, error FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def result_path(self, job_id):
+        return os.path.join(self.folder, job_id + '.out.txt')
@@ -1,19 +1,11 @@
-from nltk import text
+import sys
 import idiomcorpus
-import nltk
-nltk.download('punkt')
-from mtranslate import translate
-from indic_transliteration import sanscript
-from indic_transliteration.sanscript import transliterate
-from nltk.tokenize import word_tokenize
-from englisttohindi.englisttohindi import EngtoHindi
-import enchant
+import resources
+from resources import word_tokenize
 
 import sqlite3
 from sqlite3 import Error
 
-d = enchant.Dict("en_US")
-
 def perform_operation():
     object=idiomcorpus.Idiomcorpus()
     object.idiom_init(result)
@@ -55,6 +47,34 @@ def first(rtext):
     except Error as e:
         print("Fail")     
 
+def batch_mode(paths):
+    """
+    Convert the given Hinglish text files with batched translator round trips
+    """
+    import app
+
+    texts = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            texts.append(f.read())
+    outputs, stats = app.conversion_batch(texts)
+    for path, output in zip(paths, outputs):
+        print("\n***********" + path + "***************")
+        print(output)
+    print("\n***********Batch stats***************")
+    print(stats['calls'], "translator calls for", stats['segments'], "segments,",
+          stats['saved'], "round trips saved,", stats['cached'], "texts from cache")
+
+# python main.py file1.txt file2.txt ... converts files in batch mode
+if len(sys.argv) > 1:
+    batch_mode(sys.argv[1:])
+    sys.exit(0)
+
+# Heavy modules are only loaded for the interactive mode
+sanscript = resources.load_module('indic_transliteration.sanscript')
+EngtoHindi = resources.load_module('englisttohindi.englisttohindi').EngtoHindi
+d = resources.dictionary()
+
 master=input("Enter Hinglish text:")
 print("\n***********I/P text***************")
 print(master)
@@ -94,7 +114,7 @@ ft = " ".join(text1)
 print(ft)
 
 #result = transliterate(master, sanscript.ITRANS, sanscript.DEVANAGARI)
-result = transliterate(ft, sanscript.ITRANS, sanscript.DEVANAGARI)
+result = sanscript.transliterate(ft, sanscript.ITRANS, sanscript.DEVANAGARI)
 print("\n*****************Final result********************")
 print(result)
 
@@ -0,0 +1,195 @@
+import bisect
+import functools
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def label_pairs(names, values):
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+class Counter():
+    """
+    Monotonic counters, one per combination of label values
+    """
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *values, amount=1):
+        with self.lock:
+            self.values[values] = self.values.get(values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self.lock:
+            items = sorted(self.values.items())
+        for values, count in items:
+            lines.append(f'{self.name}{{{label_pairs(self.labels, values)}}} {count}' if values
+                         else f'{self.name} {count}')
+        return lines
+
+
+class Gauge():
+    """
+    A value that goes up and down (e.g. requests in flight)
+    """
+
+    def __init__(self, name, help):
+        self.name, self.help = name, help
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge', f'{self.name} {self.value}']
+
+
+class Histogram():
+    """
+    Latency histograms, one per value of a single label. Observations are counted in
+    their own bucket and only made cumulative when rendered, so recording one is a
+    bisect plus two additions.
+    """
+
+    def __init__(self, name, help, label, buckets=BUCKETS):
+        self.name, self.help, self.label = name, help, label
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(value)
+            if series is None:
+                # Bucket counts (the last one is +Inf), then the sum of the observations
+                series = self.series[value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def time(self, value):
+        return Timer(self, value)
+
+    def timed(self, value):
+        """
+        Decorator recording every call of a function under `value`
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(value, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {value: list(counts) for value, counts in self.series.items()}
+        for value, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {counts[-1]}')
+            lines.append(f'{self.name}_count{{{self.label}="{value}"}} {cumulative}')
+        return lines
+
+
+class Timer():
+    """
+    Context manager recording the time spent in a block
+    """
+    __slots__ = ('histogram', 'value', 'start')
+
+    def __init__(self, histogram, value):
+        self.histogram, self.value = histogram, value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(self.value, time.perf_counter() - self.start)
+
+
+# Metrics of this process (each worker process of a multi-process server keeps its own)
+stage_seconds = Histogram('hinglish_stage_duration_seconds', 'Time spent in each pipeline stage.', 'stage')
+request_seconds = Histogram('hinglish_request_duration_seconds', 'Time to handle a request.', 'endpoint')
+requests_total = Counter('hinglish_requests_total', 'Requests handled.', ('endpoint', 'status'))
+errors_total = Counter('hinglish_request_errors_total', 'Requests that raised or returned a 5xx status.',
+                       ('endpoint',))
+in_flight = Gauge('hinglish_requests_in_flight', 'Requests being handled.')
+translated_chars_total = Counter('hinglish_translated_chars_total', 'Characters sent to translator backends.',
+                                 ('backend',))
+skipped_stages_total = Counter('hinglish_skipped_stages_total',
+                               'Network stages skipped (deadline reached or translator unavailable).', ('stage',))
+
+# Cache name -> function returning its (hits, misses)
+caches = {}
+
+
+def register_cache(name, counts):
+    caches[name] = counts
+
+
+# Translator backend -> its circuit breaker
+circuits = {}
+
+
+def register_circuit(name, breaker):
+    circuits[name] = breaker
+
+
+def render_caches():
+    hits, misses, ratios = [], [], []
+    for name, counts in sorted(caches.items()):
+        hit, miss = counts()
+        hits.append(f'hinglish_cache_hits_total{{cache="{name}"}} {hit}')
+        misses.append(f'hinglish_cache_misses_total{{cache="{name}"}} {miss}')
+        ratios.append(f'hinglish_cache_hit_ratio{{cache="{name}"}} {hit / (hit + miss) if hit + miss else 0.0}')
+    return (['# HELP hinglish_cache_hits_total Cache lookups answered from the cache.',
+             '# TYPE hinglish_cache_hits_total counter'] + hits +
+            ['# HELP hinglish_cache_misses_total Cache lookups that missed.',
+             '# TYPE hinglish_cache_misses_total counter'] + misses +
+            ['# HELP hinglish_cache_hit_ratio Share of cache lookups answered from the cache.',
+             '# TYPE hinglish_cache_hit_ratio gauge'] + ratios)
+
+
+def render_circuits():
+    lines = ['# HELP hinglish_circuit_open Whether calls to a translator backend are stopped (1) or not (0).',
+             '# TYPE hinglish_circuit_open gauge']
+    for name, breaker in sorted(circuits.items()):
+        lines.append(f'hinglish_circuit_open{{backend="{name}"}} {int(breaker.state == "open")}')
+    return lines
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format
+    """
+    lines = []
+    for metric in (requests_total, errors_total, in_flight, request_seconds, stage_seconds, translated_chars_total,
+                   skipped_stages_total):
+        lines.extend(metric.render())
+    lines.extend(render_caches())
+    lines.extend(render_circuits())
+    return '\n'.join(lines) + '\n'
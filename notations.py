@@ -0,0 +1,236 @@
+import functools
+import os
+import sqlite3
+import threading
+import time
+from sqlite3 import Error
+
+import compiled_dictionaries
+
+# Seconds between two checks of the modification time of the notation source
+RELOAD_CHECK_INTERVAL = 1.0
+
+# Lookups in a compiled (binary searched) table remembered per load
+LOOKUP_CACHE_SIZE = 4096
+
+# Key under which an inner trie node stores the long notation of the short form ending there
+# (tokens are never None)
+END = None
+
+
+class NotationTrie():
+    """
+    Short notations as a prefix trie of dicts keyed by case-folded token, for longest-match
+    expansion of token sequences. A node that no longer short form extends is stored as its
+    long notation string instead of a dict, which keeps a 100k-entry table small.
+    """
+
+    def __init__(self, entries, tokenize=str.split):
+        self.trie = {}
+        self.size = 0
+        for short, long in entries:
+            # The tokenizer may split a short form (Mr. -> Mr .); the stream it is matched
+            # against may not have (a token kept whole), so both are indexed
+            for tokens in {tuple(tokenize(short)), tuple(short.split())}:
+                if tokens:
+                    self.insert([token.lower() for token in tokens], long)
+
+    def insert(self, tokens, long):
+        """
+        Add a short form unless it is already there (the first row per folded key wins)
+        """
+        node = self.trie
+        for token in tokens[:-1]:
+            child = node.get(token)
+            if child is None:
+                child = node[token] = {}
+            elif isinstance(child, str):
+                child = node[token] = {END: child}
+            node = child
+        last = tokens[-1]
+        child = node.get(last)
+        if child is None:
+            node[last] = long
+        elif isinstance(child, dict) and END not in child:
+            child[END] = long
+        else:
+            return
+        self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    def longest(self, words, pos):
+        """
+        (long notation, end) of the longest short form at words[pos:end], or (None, pos)
+        """
+        node, found, end = self.trie, None, pos
+        for nxt in range(pos, len(words)):
+            node = node.get(words[nxt].lower())
+            if node is None:
+                break
+            if isinstance(node, str):
+                return node, nxt + 1
+            if END in node:
+                found, end = node[END], nxt + 1
+        return found, end
+
+    def matches(self, words):
+        """
+        (first, last + 1, long notation) of the short forms in words, found left to right by
+        longest match. Each step walks at most as many nodes as the longest short form has
+        tokens, so the pass is linear in the input whatever the size of the table.
+        """
+        matches = []
+        pos, n = 0, len(words)
+        while pos < n:
+            long, end = self.longest(words, pos)
+            if long is None:
+                pos += 1
+                continue
+            matches.append((pos, end, long))
+            pos = end
+        return matches
+
+
+class NotationIndex():
+    """
+    In-memory, case-folded copy of the Keys table (short -> long notation), also as a
+    NotationTrie of short forms split by `tokenize` (the tokenizer of the text they are
+    matched in), built on first use so that loading does not import the tokenizer.
+
+    With `dictionaries_file`, the table is the one compiled into it (a memory-mapped
+    compiled_dictionaries file), rebuilt from the notation CSV when it is stale; the CSV
+    is read directly if the file cannot be rebuilt. The database is not read then: the CSV
+    is the source of the notations. Without it, the table is read from the database.
+    The table is loaded once and reloaded when its source changes on disk.
+    """
+
+    def __init__(self, db_file, check_interval=RELOAD_CHECK_INTERVAL, tokenize=str.split, dictionaries_file=None,
+                 notations_file=compiled_dictionaries.NOTATIONS_CSV_PATH):
+        self.db_file = db_file
+        self.dictionaries_file = dictionaries_file
+        self.notations_file = notations_file
+        self.dictionaries = None
+        self.check_interval = check_interval
+        self.tokenize = tokenize
+        self.notations = {}
+        self.get = self.notations.get
+        self.rows = []
+        self.trie = None
+        self.trie_lock = threading.Lock()
+        self.mtime = None
+        self.next_check = 0.0
+        self.load()
+
+    def mtimes(self):
+        """
+        Modification times of the watched files (None for a missing one): the compiled
+        file and the CSV it is built from, or the database
+        """
+        if self.dictionaries_file is not None:
+            paths = (self.dictionaries_file, self.notations_file)
+        else:
+            paths = (self.db_file,)
+        return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in paths)
+
+    def load(self):
+        """
+        Map the compiled table, or read the whole CSV or Keys table into the lookup dictionary
+        """
+        if self.dictionaries_file is not None:
+            before = self.mtimes()
+            dictionaries = compiled_dictionaries.load_current(self.dictionaries_file, self.notations_file)
+            if dictionaries is not None:
+                # Lookups read the sorted table in place
+                self.dictionaries = dictionaries
+                self.notations = dictionaries.notations
+                self.get = functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)(dictionaries.notations.get)
+                self.rows, self.trie = dictionaries.notation_rows, None
+                # The compiled file may have just been rebuilt: a CSV change during the build is still seen
+                self.mtime = self.mtimes()[:1] + before[1:]
+                return True
+            try:
+                rows = compiled_dictionaries.read_notations(self.notations_file)
+            except (OSError, ValueError) as e:
+                print(f"Notation loading error: {e}")
+                return False
+            self.use_rows(rows, before)
+            return True
+        try:
+            # sqlite3 would create a missing database
+            os.stat(self.db_file)
+            mtime = self.mtimes()
+            conn = sqlite3.connect(self.db_file)
+            try:
+                rows = conn.execute(
+                    "SELECT Short_Notations, Long_Notations FROM Keys ORDER BY rowid").fetchall()
+            finally:
+                conn.close()
+        except (Error, OSError) as e:
+            print(f"Notation loading error: {e}")
+            return False
+        self.use_rows(rows, mtime)
+        return True
+
+    def use_rows(self, rows, mtime):
+        """
+        Serve (short, long) rows read from the CSV or the database
+        """
+        notations = {}
+        for short, long in rows:
+            # Keep the first row per folded key, like "WHERE LOWER(...) = ?" with fetchone()
+            notations.setdefault(short.lower(), long)
+        # Swap the whole dictionary so readers never see a half-built table
+        self.dictionaries, self.notations = None, notations
+        self.get = notations.get
+        self.rows, self.trie = rows, None
+        self.mtime = mtime
+
+    def reload_if_changed(self):
+        """
+        Reload the table if a watched file was modified since the last load
+        """
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + self.check_interval
+        try:
+            mtime = self.mtimes()
+        except OSError:
+            return
+        if mtime != self.mtime:
+            self.load()
+
+    def lookup(self, rtext):
+        """
+        Return the long notation for the given text, or the text itself if there is none
+        """
+        self.reload_if_changed()
+        return self.get(rtext.lower(), rtext)
+
+    def notation_trie(self):
+        """
+        The NotationTrie of the loaded rows, built on first use after each load
+        """
+        trie = self.trie
+        if trie is None:
+            with self.trie_lock:
+                trie = self.trie
+                if trie is None:
+                    rows = self.rows
+                    trie = NotationTrie(rows, self.tokenize)
+                    # Unless the table was reloaded meanwhile
+                    if rows is self.rows:
+                        self.trie = trie
+        return trie
+
+    def matches(self, words):
+        """
+        Short forms, of one or more tokens, found in a token list (see NotationTrie.matches)
+        """
+        self.reload_if_changed()
+        return self.notation_trie().matches(words)
+
+    def __len__(self):
+        return len(self.notations)
@@ -0,0 +1,116 @@
+import codecs
+import os
+import re
+import threading
+
+LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hinglish_lexicon.tsv")
+
+# Runs of letters (apostrophes allowed inside), i.e. the words the lexicon is matched against
+WORD = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*")
+
+# Key under which a phrase trie node stores the translation of the phrase ending there
+END = ''
+
+
+class Lexicon():
+    """
+    Roman Hinglish -> English word and phrase table, translated by longest match.
+
+    Phrases are kept in a trie of dicts keyed by lowercased word, so matching at a
+    position walks at most as many nodes as the longest phrase has words and the
+    whole text is translated in one left-to-right pass. Words that are not in the
+    lexicon (English words, names, numbers) are kept as they are.
+    """
+
+    def __init__(self, entries):
+        self.trie = {}
+        self.size = 0
+        for hinglish, english in entries:
+            node = self.trie
+            for word in hinglish.lower().split():
+                node = node.setdefault(word, {})
+            if END not in node:
+                self.size += 1
+            node[END] = english
+
+    @classmethod
+    def from_file(cls, path):
+        entries = []
+        with codecs.open(path, encoding="utf-8", mode="r") as fin:
+            for line in fin:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                hinglish, english = line.rstrip('\n').split('\t')
+                entries.append((hinglish.strip(), english.strip()))
+        return cls(entries)
+
+    def __len__(self):
+        return self.size
+
+    def translate(self, text):
+        """
+        Translate text, keeping the punctuation and spacing between the translated words
+        """
+        matches = WORD.findall(text)
+        if not matches:
+            return text
+        # Separators around the words: gaps[i] comes before word i
+        gaps = WORD.split(text)
+        trie = self.trie
+        out = [gaps[0]]
+        pos, n = 0, len(matches)
+        while pos < n:
+            word = matches[pos]
+            node = trie.get(word.lower())
+            if node is None:
+                out.append(word)
+                out.append(gaps[pos + 1])
+                pos += 1
+                continue
+            # Longest phrase starting here; phrases only span words separated by whitespace
+            found, end = node.get(END), pos + 1
+            nxt = pos + 1
+            while nxt < n and gaps[nxt].isspace():
+                node = node.get(matches[nxt].lower())
+                if node is None:
+                    break
+                nxt += 1
+                if END in node:
+                    found, end = node[END], nxt
+            if found is None:
+                out.append(word)
+                out.append(gaps[pos + 1])
+                pos += 1
+                continue
+            if word[0].isupper():
+                found = found[0].upper() + found[1:]
+            out.append(found)
+            out.append(gaps[end])
+            pos = end
+        return ''.join(out)
+
+    def translate_batch(self, texts):
+        return [self.translate(text) for text in texts]
+
+
+lexicon = None
+lexicon_lock = threading.Lock()
+
+
+def load_lexicon(path=LEXICON_PATH):
+    """
+    Return the process-wide lexicon, reading hinglish_lexicon.tsv on first use only
+    """
+    global lexicon
+    if lexicon is None:
+        with lexicon_lock:
+            if lexicon is None:
+                lexicon = Lexicon.from_file(path)
+    return lexicon
+
+
+def translate(text):
+    """
+    Translate Roman Hinglish text to English without any network call
+    """
+    return load_lexicon().translate(text)
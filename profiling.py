@@ -0,0 +1,55 @@
+import cProfile
+import hmac
+import os
+import re
+import time
+import uuid
+
+# Request header carrying the admin token that turns profiling on for that request
+PROFILE_HEADER = 'X-Profile'
+
+# Response header naming the saved profile
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+PROFILE_NAME = re.compile(r'^[\w.-]+\.prof$')
+
+
+class RequestProfiler():
+    """
+    Deterministic (cProfile) profiles of single requests, written to `folder` as pstats
+    files that can be opened with `python -m pstats` or snakeviz.
+
+    cProfile follows the thread that handles the request, so work handed to other
+    threads (the async pipeline's translator calls) shows up as waiting time.
+    """
+
+    def __init__(self, token, folder):
+        self.token = token
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def requested(self, token):
+        return token is not None and hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8'))
+
+    def start(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def save(self, profile, label):
+        """
+        Stop the profile and write it out; returns the name it was saved under
+        """
+        profile.disable()
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:8]}.prof"
+        profile.dump_stats(os.path.join(self.folder, name))
+        return name
+
+    def path(self, name):
+        """
+        Path of a saved profile, or None if there is no such profile
+        """
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.folder, name)
+        return path if os.path.isfile(path) else None
@@ -0,0 +1,118 @@
+import importlib
+import os
+import threading
+
+# NLTK data used by word_tokenize ("punkt_tab" replaces "punkt" from NLTK 3.8.2 on)
+NLTK_RESOURCES = {'punkt': 'tokenizers/punkt', 'punkt_tab': 'tokenizers/punkt_tab'}
+
+modules = {}
+nltk_word_tokenize = None
+google_translator = None
+english_dictionary = None
+lock = threading.RLock()
+
+# A worker process forked while another thread imports would inherit the lock held
+# forever, and half-imported modules: forking waits until the import has finished
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=lock.acquire, after_in_parent=lock.release, after_in_child=lock.release)
+
+
+def load_module(name):
+    """
+    Import a heavy module on first use. Imports are serialized because threads importing
+    nltk at the same time (directly or through textblob) can see partially initialized modules.
+    """
+    module = modules.get(name)
+    if module is None:
+        with lock:
+            module = modules.get(name)
+            if module is None:
+                module = modules[name] = importlib.import_module(name)
+    return module
+
+
+def missing_nltk_resources():
+    """
+    Names of the required NLTK resources that are not installed (checked offline)
+    """
+    nltk = load_module('nltk')
+    missing = []
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(name)
+    return missing
+
+
+def ensure_nltk_resources():
+    """
+    Download the NLTK resources that are missing; nothing touches the network when all are installed
+    """
+    missing = missing_nltk_resources()
+    for name in missing:
+        if not load_module('nltk').download(name, quiet=True):
+            print(f"NLTK resource '{name}' could not be downloaded")
+    return missing
+
+
+def tokenizer():
+    """
+    nltk.word_tokenize, imported on first use once the NLTK data it needs is installed.
+    A request that arrives while the preload is downloading the data waits for it.
+    """
+    global nltk_word_tokenize
+    if nltk_word_tokenize is None:
+        with lock:
+            if nltk_word_tokenize is None:
+                ensure_nltk_resources()
+                nltk_word_tokenize = load_module('nltk.tokenize').word_tokenize
+    return nltk_word_tokenize
+
+
+def word_tokenize(text):
+    """
+    nltk.word_tokenize, imported on first use
+    """
+    return tokenizer()(text)
+
+
+def translator():
+    """
+    Shared googletrans Translator, created on first use
+    """
+    global google_translator
+    if google_translator is None:
+        with lock:
+            if google_translator is None:
+                google_translator = load_module('googletrans').Translator()
+    return google_translator
+
+
+def dictionary():
+    """
+    Shared enchant en_US dictionary, created on first use
+    """
+    global english_dictionary
+    if english_dictionary is None:
+        with lock:
+            if english_dictionary is None:
+                english_dictionary = load_module('enchant').Dict("en_US")
+    return english_dictionary
+
+
+def preload_in_background(steps):
+    """
+    Run warm-up steps (imports, data loading) in a daemon thread so that
+    start-up does not wait for them; a failing step is reported and skipped
+    """
+    def run():
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                print(f"Preload error in {getattr(step, '__name__', step)}: {e}")
+
+    thread = threading.Thread(target=run, name='preload', daemon=True)
+    thread.start()
+    return thread
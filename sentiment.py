@@ -0,0 +1,158 @@
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+import resources
+
+# Word polarity below / above these bounds counts as negative / positive
+NEGATIVE_BELOW = -0.05
+POSITIVE_ABOVE = 0.05
+
+# Only texts up to this many characters (not counting whitespace) are memoized whole:
+# a memo entry keeps its text alive, and longer texts rarely repeat. Their words are
+# still memoized one by one (word_tokens, pattern_polarity).
+MEMO_MAX_CHARS = 2048
+MEMO_SIZE = 1024
+
+lexicon = None
+lexicon_lock = threading.Lock()
+
+
+def pattern():
+    """
+    TextBlob's pattern sentiment scorer, imported on first use
+    """
+    return resources.load_module('textblob.en').sentiment
+
+
+def load_lexicon():
+    """
+    Build the word -> polarity table once from TextBlob's pattern lexicon (en-sentiment.xml).
+    A lone word scores its averaged lexicon polarity, which is what TextBlob(word) returns.
+    """
+    global lexicon
+    if lexicon is None:
+        with lexicon_lock:
+            if lexicon is None:
+                pattern_sentiment = pattern()
+                pattern_sentiment.load()
+                lexicon = {word: senses[None][0] for word, senses in pattern_sentiment.items()
+                           if None in senses}
+    return lexicon
+
+
+@lru_cache(maxsize=65536)
+def word_tokens(word):
+    """
+    Pattern tokens of one whitespace-separated word, lower-cased as the scorer sees them
+    """
+    if word.isalpha():
+        return (word.lower(),)
+    return tuple(token.lower() for token in " ".join(pattern().tokenizer(word)).split())
+
+
+def average_polarity(tokens):
+    """
+    Mean polarity of the pattern assessments of a token sequence, as TextBlob computes it
+    """
+    assessments = pattern().assessments(((token, None) for token in tokens), True)
+    return sum(assessment[1] for assessment in assessments) / float(len(assessments) or 1)
+
+
+@lru_cache(maxsize=65536)
+def pattern_polarity(word):
+    return average_polarity(word_tokens(word))
+
+
+def word_polarity(word):
+    """
+    Polarity of a single word, equal to TextBlob(word).sentiment.polarity
+    """
+    if word.isalpha():
+        # A word made of letters only is a single token: unknown words score 0
+        return load_lexicon().get(word.lower(), 0.0)
+    # Punctuation, emoticons, "!" boosts, contractions... go through the pattern scorer (memoized)
+    return pattern_polarity(word)
+
+
+def bucket_words(words):
+    """
+    Split words into (negative, neutral, positive) lists in a single pass
+    """
+    negative, neutral, positive = [], [], []
+    for word in words:
+        polarity = word_polarity(word)
+        if polarity < NEGATIVE_BELOW:
+            negative.append(word)
+        elif polarity > POSITIVE_ABOVE:
+            positive.append(word)
+        else:
+            neutral.append(word)
+    return negative, neutral, positive
+
+
+def bucket_batch(texts):
+    """
+    Bucket the words of many texts at once; the lexicon and memo are shared across the batch
+    """
+    return [bucket_words(text.split()) for text in texts]
+
+
+def label(polarity):
+    """
+    Sentiment label and emoji for an overall polarity
+    """
+    if polarity > POSITIVE_ABOVE:
+        return 'Positive', '😄'  # Smiling face
+    if polarity < NEGATIVE_BELOW:
+        return 'Negative', '😞'  # Sad face
+    return 'Neutral', '😐'  # Neutral face
+
+
+Analysis = namedtuple('Analysis', ['polarity', 'sentiment', 'emoji', 'negative', 'neutral', 'positive'])
+
+
+def analyze(text):
+    """
+    Overall polarity, label, emoji and the negative/neutral/positive words of a text,
+    all from a single whitespace tokenization. Repeated short texts are answered from the memo.
+    """
+    return analyze_words(tuple(text.split()))
+
+
+def analyze_words(words):
+    """
+    analyze() for a text already split into words (a tuple equal to text.split())
+    """
+    if sum(map(len, words)) <= MEMO_MAX_CHARS:
+        return memo_analysis(words)
+    return word_analysis(words)
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def memo_analysis(words):
+    return word_analysis(words)
+
+
+def word_analysis(words):
+    """
+    Analysis of a tuple of words.
+
+    TextBlob's pattern tokenizer splits each whitespace-separated word independently,
+    so the overall score is computed on the concatenated (memoized) per-word tokens and
+    equals TextBlob(text).sentiment.polarity.
+    """
+    tokens = []
+    negative, neutral, positive = [], [], []
+    for word in words:
+        tokens.extend(word_tokens(word))
+        polarity = word_polarity(word)
+        if polarity < NEGATIVE_BELOW:
+            negative.append(word)
+        elif polarity > POSITIVE_ABOVE:
+            positive.append(word)
+        else:
+            neutral.append(word)
+    polarity = average_polarity(tokens)
+    sentiment, emoji = label(polarity)
+    return Analysis(polarity, sentiment, emoji, tuple(negative), tuple(neutral), tuple(positive))
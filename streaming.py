@@ -0,0 +1,52 @@
+import codecs
+
+# Bytes read from the upload at a time
+CHUNK_SIZE = 64 * 1024
+
+# A paragraph longer than this is cut at the last line break (or space) before the limit
+MAX_PARAGRAPH_CHARS = 16 * 1024
+
+
+def read_paragraphs(stream, encoding='utf-8', chunk_size=CHUNK_SIZE, max_chars=MAX_PARAGRAPH_CHARS):
+    """
+    Yield the paragraphs (separated by blank lines) of a binary stream, reading it chunk by chunk.
+    At most one chunk and one paragraph are held in memory at a time.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    pending = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        pending += decoder.decode(chunk or b'', final=not chunk)
+        pending = pending.replace('\r\n', '\n')
+        while True:
+            end = pending.find('\n\n')
+            if end == -1:
+                if len(pending) <= max_chars:
+                    break
+                # No paragraph break in sight: cut at a line break or space to bound memory
+                end = max(pending.rfind('\n', 0, max_chars), pending.rfind(' ', 0, max_chars))
+                if end <= 0:
+                    end = max_chars
+                paragraph, pending = pending[:end], pending[end:].lstrip(' \n')
+            else:
+                paragraph, pending = pending[:end], pending[end:].lstrip('\n')
+            if paragraph.strip():
+                yield paragraph
+        if not chunk:
+            break
+    if pending.strip():
+        yield pending
+
+
+def convert_paragraphs(paragraphs, convert):
+    """
+    Convert paragraphs one at a time, yielding each result followed by a blank line.
+    A paragraph that fails to convert is passed through unchanged.
+    """
+    for paragraph in paragraphs:
+        try:
+            converted = convert(paragraph)
+        except Exception as e:
+            print(f"Paragraph conversion error: {e}")
+            converted = paragraph
+        yield converted + '\n\n'
@@ -0,0 +1,138 @@
+import re
+
+# Characters str.split() separates words on
+WHITESPACE = re.compile(r'\s')
+
+# word_tokenize turns double quotes into these
+QUOTES = ('``', "''")
+
+
+class TokenStream():
+    """
+    Tokens of one text with their (start, end) offsets in it, tokenized once and
+    then edited in place by each stage (notation expansion, spell check, idioms).
+
+    The tokens are kept as parallel lists. A token that replaces others keeps the
+    offsets of the span it replaced, so every token can be traced back to the text.
+    """
+
+    def __init__(self, source, words, starts, ends):
+        self.source = source
+        self.words = words
+        self.starts = starts
+        self.ends = ends
+        # Spell check result per token (None until checked)
+        self.known = [None] * len(words)
+
+    @classmethod
+    def tokenize(cls, text, tokenize):
+        """
+        Tokenize text with `tokenize` (e.g. word_tokenize) and locate each token in it
+        """
+        words = tokenize(text)
+        starts, ends = [], []
+        cursor = 0
+        for word in words:
+            start = text.find(word, cursor)
+            if start == -1 and word in QUOTES:
+                start = text.find('"', cursor)
+                end = start + 1
+            else:
+                end = start + len(word)
+            if start == -1:
+                # Not found verbatim (normalized by the tokenizer): an empty span at the cursor
+                start = end = cursor
+            starts.append(start)
+            ends.append(end)
+            cursor = end
+        return cls(text, words, starts, ends)
+
+    @classmethod
+    def split(cls, text, sep=' '):
+        """
+        Split text on `sep` like str.split(sep), keeping the offsets
+        """
+        words = text.split(sep)
+        starts, ends = [], []
+        cursor = 0
+        for word in words:
+            starts.append(cursor)
+            cursor += len(word)
+            ends.append(cursor)
+            cursor += len(sep)
+        return cls(text, words, starts, ends)
+
+    def __len__(self):
+        return len(self.words)
+
+    def text(self):
+        return ' '.join(self.words)
+
+    def span(self, pos):
+        return self.starts[pos], self.ends[pos]
+
+    def is_split(self):
+        """
+        True when the words are exactly text().split(), so word-level stages can use them directly
+        """
+        return all(word and not WHITESPACE.search(word) for word in self.words)
+
+    def runs(self, select):
+        """
+        (first, last + 1) positions of the runs of consecutive tokens for which select(pos) is true
+        """
+        runs, first = [], None
+        for pos in range(len(self.words)):
+            if select(pos):
+                if first is None:
+                    first = pos
+            elif first is not None:
+                runs.append((first, pos))
+                first = None
+        if first is not None:
+            runs.append((first, len(self.words)))
+        return runs
+
+    def replace_runs(self, runs, replacements):
+        """
+        Replace each run of tokens by a list of words, which share the offsets of the whole run
+        """
+        words, starts, ends, known = [], [], [], []
+        cursor = 0
+        for (first, last), replaced in zip(runs, replacements):
+            words.extend(self.words[cursor:first])
+            starts.extend(self.starts[cursor:first])
+            ends.extend(self.ends[cursor:first])
+            known.extend(self.known[cursor:first])
+            words.extend(replaced)
+            starts.extend([self.starts[first]] * len(replaced))
+            ends.extend([self.ends[last - 1]] * len(replaced))
+            known.extend([None] * len(replaced))
+            cursor = last
+        words.extend(self.words[cursor:])
+        starts.extend(self.starts[cursor:])
+        ends.extend(self.ends[cursor:])
+        known.extend(self.known[cursor:])
+        self.words, self.starts, self.ends, self.known = words, starts, ends, known
+
+    def delete(self, pos):
+        del self.words[pos], self.starts[pos], self.ends[pos], self.known[pos]
+
+    def substitute(self, idiom, meaning):
+        """
+        Write the meaning words over the idiom's first word onwards, then remove the
+        idiom's words (first occurrence of each), as Idiomcorpus always has.
+        Returns False, leaving the stream untouched, if the idiom's first word is absent.
+        """
+        words = self.words
+        if idiom[0] not in words:
+            return False
+        pos = words.index(idiom[0])
+        for word in meaning:
+            words[pos] = word
+            self.known[pos] = None
+            pos += 1
+        for word in idiom:
+            if word in words:
+                self.delete(words.index(word))
+        return True
@@ -0,0 +1,207 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from sqlite3 import Error
+
+# Default limits of the on-disk translation cache
+MAX_ENTRIES = 20000
+TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Reads never write: hit/miss counts and last-used times are kept in memory and written
+# at most every FLUSH_SECONDS (and with every put). A hit refreshes an entry's last-used
+# time only if it is older than TOUCH_SECONDS, so LRU order is exact to that resolution.
+FLUSH_SECONDS = 5.0
+TOUCH_SECONDS = 60.0
+# Seconds between two sweeps of the expired entries (expired entries are misses meanwhile)
+EXPIRE_SECONDS = 60.0
+
+
+class TranslationCache():
+    """
+    Content-addressed translation cache stored in SQLite (WAL mode).
+
+    Entries are keyed by a hash of the backend, target language and source text,
+    expire after `ttl` seconds and are evicted least-recently-used first once the
+    table holds more than `max_entries` rows. The database file may be shared by
+    several worker processes; each thread uses its own connection. The row count is
+    kept in the counters table, updated in the same transaction as the rows.
+    """
+
+    def __init__(self, db_file, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Not yet written to the database: counter increments and key -> last-used time
+        self.pending = {'hits': 0, 'misses': 0}
+        self.touched = {}
+        self.next_flush = time.monotonic() + FLUSH_SECONDS
+        self.next_expiry = 0.0
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.create_table()
+
+    def connect(self):
+        """
+        Return this thread's connection, opening it on first use
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            # Connections must not cross a fork, so reopen in the child
+            conn = sqlite3.connect(self.db_file, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def create_table(self):
+        try:
+            conn = self.connect()
+            conn.execute("""CREATE TABLE IF NOT EXISTS translations (
+                                key TEXT PRIMARY KEY,
+                                translation TEXT NOT NULL,
+                                created REAL NOT NULL,
+                                last_used REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS counters (
+                                name TEXT PRIMARY KEY,
+                                value INTEGER NOT NULL)""")
+            conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)")
+            # Counted once, when a cache file from before the tracked count is opened
+            conn.execute("INSERT OR IGNORE INTO counters SELECT 'entries', COUNT(*) FROM translations")
+        except Error as e:
+            print(f"Translation cache opening error: {e}")
+
+    @staticmethod
+    def make_key(text, dest, backend):
+        return hashlib.sha256(f"{backend}\0{dest}\0{text}".encode('utf-8')).hexdigest()
+
+    def count(self, name, key=None, now=None):
+        """
+        Count a hit or a miss (and a hit's new last-used time) in memory
+        """
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+            self.pending[name] += 1
+            if key is not None:
+                self.touched[key] = now
+            due = time.monotonic() >= self.next_flush
+        if due:
+            self.flush()
+
+    def take_pending(self):
+        """
+        Swap out the unwritten counts and touches
+        """
+        with self.lock:
+            pending, touched = self.pending, self.touched
+            self.pending, self.touched = {'hits': 0, 'misses': 0}, {}
+            self.next_flush = time.monotonic() + FLUSH_SECONDS
+        return pending, touched
+
+    def write_pending(self, conn, pending, touched):
+        """
+        Write counts and touches taken by take_pending() (inside a transaction)
+        """
+        for name, value in pending.items():
+            if value:
+                conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (value, name))
+        if touched:
+            conn.executemany("UPDATE translations SET last_used = MAX(last_used, ?) WHERE key = ?",
+                             [(when, key) for key, when in touched.items()])
+
+    def flush(self):
+        """
+        Write the counts and touches kept in memory in one transaction
+        """
+        pending, touched = self.take_pending()
+        if not touched and not any(pending.values()):
+            return
+        try:
+            conn = self.connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.write_pending(conn, pending, touched)
+                conn.execute("COMMIT")
+            except Error:
+                conn.execute("ROLLBACK")
+                raise
+        except Error as e:
+            print(f"Translation cache write error: {e}")
+
+    def get(self, text, dest='en', backend='google'):
+        """
+        Return the cached translation of text, or None on a miss
+        """
+        key = self.make_key(text, dest, backend)
+        now = time.time()
+        try:
+            row = self.connect().execute("SELECT translation, created, last_used FROM translations WHERE key = ?",
+                                         (key,)).fetchone()
+        except Error as e:
+            print(f"Translation cache read error: {e}")
+            return None
+        if row is None or now - row[1] > self.ttl:
+            self.count('misses')
+            return None
+        self.count('hits', key if now - row[2] > TOUCH_SECONDS else None, now)
+        return row[0]
+
+    def put(self, text, translation, dest='en', backend='google'):
+        """
+        Store a translation and evict expired and least-recently-used entries
+        """
+        key = self.make_key(text, dest, backend)
+        now = time.time()
+        pending, touched = self.take_pending()
+        touched.pop(key, None)
+        with self.lock:
+            sweep = time.monotonic() >= self.next_expiry
+            if sweep:
+                self.next_expiry = time.monotonic() + EXPIRE_SECONDS
+        try:
+            conn = self.connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.write_pending(conn, pending, touched)
+                entries = conn.execute("SELECT value FROM counters WHERE name = 'entries'").fetchone()[0]
+                added = conn.execute("INSERT OR IGNORE INTO translations VALUES (?, ?, ?, ?)",
+                                     (key, translation, now, now)).rowcount
+                if not added:
+                    conn.execute("UPDATE translations SET translation = ?, created = ?, last_used = ? WHERE key = ?",
+                                 (translation, now, now, key))
+                entries += added
+                if sweep:
+                    entries -= conn.execute("DELETE FROM translations WHERE created < ?", (now - self.ttl,)).rowcount
+                if entries > self.max_entries:
+                    entries -= conn.execute("""DELETE FROM translations WHERE key IN (
+                                                   SELECT key FROM translations WHERE key != ? ORDER BY last_used
+                                                   LIMIT ?)""", (key, entries - self.max_entries)).rowcount
+                conn.execute("UPDATE counters SET value = ? WHERE name = 'entries'", (entries,))
+                conn.execute("COMMIT")
+            except Error:
+                conn.execute("ROLLBACK")
+                raise
+        except Error as e:
+            print(f"Translation cache write error: {e}")
+
+    def stats(self):
+        """
+        Hit/miss counters of this process and of every process sharing the cache file
+        """
+        self.flush()
+        result = {'hits': self.hits, 'misses': self.misses, 'entries': 0, 'total_hits': 0, 'total_misses': 0}
+        try:
+            conn = self.connect()
+            for name, value in conn.execute("SELECT name, value FROM counters"):
+                if name == 'entries':
+                    result['entries'] = value
+                else:
+                    result['total_' + name] = value
+        except Error as e:
+            print(f"Translation cache read error: {e}")
+        return result